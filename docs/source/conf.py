@@ -30,6 +30,9 @@ extensions = [
 templates_path = ['_templates']
 exclude_patterns = []
 
+# optional dependencies, not needed to build the doc
+autodoc_mock_imports = ['numpy']
+
 
 # -- Options for HTML output -------------------------------------------------
 # https://www.sphinx-doc.org/en/master/usage/configuration.html#options-for-html-output
@@ -1,18 +1,146 @@
 import binascii
+import collections
 import copy
+import errno
+import functools
+import io
 import logging
-import sys
+import mmap
+import operator
+import os
+import struct
+import threading
+import time
+from array import array
 
-try:
+# bitarray is imported only by BitFiFo and pysatl only when tracing is enabled,
+# hashing needs only the standard library.
+
+
+def _utils():
+    """Return pysatl Utils, used to format traces"""
     from pysatl import Utils
-except ImportError:
-    pass  # we just don't support logging
 
-from bitarray import bitarray
+    return Utils
+
+
+def _tracing_available():
+    """Return True if pysatl can be imported, tracing is silently disabled otherwise"""
+    try:
+        import pysatl  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+_MASK64 = (1 << 64) - 1
+
+
+def _round_constants():
+    """Compute the 24 round constants of the iota step using the LFSR defined in FIPS 202."""
+    out = []
+    r = 1
+    for _round in range(24):
+        rc = 0
+        for j in range(7):
+            r = ((r << 1) ^ ((r >> 7) * 0x71)) % 256
+            if r & 2:
+                rc ^= 1 << ((1 << j) - 1)
+        out.append(rc)
+    return tuple(out)
+
+
+def _rho_pi_tables():
+    """Compute the rho rotation offsets and the pi destination of each lane.
+    Lanes are indexed as x + 5 * y.
+    """
+    rho = [0] * 25
+    pi = [0] * 25
+    for x in range(5):
+        for y in range(5):
+            pi[x + 5 * y] = y + 5 * ((2 * x + 3 * y) % 5)
+    (x, y) = (1, 0)
+    for t in range(24):
+        rho[x + 5 * y] = ((t + 1) * (t + 2) // 2) % 64
+        (x, y) = (y, (2 * x + 3 * y) % 5)
+    return tuple(rho), tuple(pi)
+
+
+_ROUND_CONSTANTS = _round_constants()
+_RHO_OFFSETS, _PI_LANES = _rho_pi_tables()
+
+
+# export_state_bytes layout: header, 25 little endian lanes, pending input (or remaining output once finalized)
+_STATE_MAGIC = b'S3BS'
+_STATE_VERSION = 1
+_STATE_HEADER = struct.Struct('<4sBHBHBI')  # magic, version, capacity, suffix length, suffix bits, flags, bitlen
+_STATE_FINALIZED = 1
+_STATE_VERBOSE = 2
+_STATE_DIGEST = 4  # finalized SHA3 object, lanes are not stored and pending bytes are the digest
+_STATE_ROUNDS_SHIFT = 3  # flags bits 3 to 7 hold 24 minus the number of rounds of Keccak-p
+
+
+def _pack_state(capacity, suffix, flags, lanes, pending, bitlen):
+    if len(suffix) > 16:
+        raise ValueError('suffix longer than 16 bits cannot be serialized')
+    suffix_bits = int(suffix[::-1], 2) if suffix else 0
+    header = _STATE_HEADER.pack(_STATE_MAGIC, _STATE_VERSION, capacity, len(suffix), suffix_bits, flags, bitlen)
+    return header + _lanes_struct(25).pack(*lanes) + bytes(pending[0 : (bitlen + 7) // 8])
+
+
+def _unpack_state(data):
+    """Parse the header of a serialized state.
+    Return capacity, suffix, flags, bitlen and the offsets of the lanes and the pending input.
+    """
+    magic, version, capacity, suffix_len, suffix_bits, flags, bitlen = _STATE_HEADER.unpack_from(data)
+    if magic != _STATE_MAGIC:
+        raise ValueError('not a serialized sha3bit state')
+    if version != _STATE_VERSION:
+        raise ValueError('unsupported serialized state version: %d' % version)
+    suffix = ''.join('1' if (suffix_bits >> i) & 1 else '0' for i in range(suffix_len))
+    lanes_offset = _STATE_HEADER.size
+    pending_offset = lanes_offset + 25 * 8
+    if len(data) < pending_offset + (bitlen + 7) // 8:
+        raise ValueError('truncated serialized state')
+    return capacity, suffix, flags, bitlen, lanes_offset, pending_offset
+
+
+_REVERSED_BITS = bytes(int(format(i, '08b')[::-1], 2) for i in range(256))
+_SHIFT_SLICE = 1 << 16  # bytes shifted at once by the non byte aligned absorb
+
+
+def _bitarray_input(bits, bitlen):
+    """Return the buffer of a bitarray in the bit order used by Keccak (little endian) and its bit length"""
+    if bitlen is None:
+        bitlen = len(bits)
+    endian = bits.endian
+    if callable(endian):  # method before bitarray 3
+        endian = endian()
+    if 'big' == endian:
+        return bits.tobytes().translate(_REVERSED_BITS), bitlen
+    return bits, bitlen
+
+
+@functools.lru_cache(maxsize=None)
+def _lanes_struct(nlanes):
+    """Struct decoding nlanes little endian 64 bit lanes."""
+    return struct.Struct('<%dQ' % nlanes)
+
+
+@functools.lru_cache(maxsize=None)
+def _sponge_parameters(capacity, suffix, rounds=24):
+    """Return capacity, suffix, rate, rate in bytes and round constants of Keccak-p[1600, rounds]
+    as objects shared by all the sponges using them.
+    """
+    return capacity, suffix, 1600 - capacity, (1600 - capacity) // 8, _ROUND_CONSTANTS[24 - rounds :]
 
 
 class BitFiFo:
+    __slots__ = ('bitlen', 'buf', 'full_threshold')
+
     def __init__(self, bitlen, full_threshold=None):
+        from bitarray import bitarray
+
         self.buf = bitarray(endian='little')
         self.bitlen = bitlen
         if full_threshold is None:
@@ -46,6 +174,8 @@ class BitFiFo:
         self.buf += data
 
     def push_bytes(self, data, bitlen=None):
+        from bitarray import bitarray
+
         data_bits = bitarray(endian='little')
         data_bits.frombytes(data)
         if bitlen is not None:
@@ -53,6 +183,8 @@ class BitFiFo:
         self.push(data_bits)
 
     def push_consume_bytes(self, data, bitlen=None):
+        from bitarray import bitarray
+
         data_bits = bitarray(endian='little')
         data_bits.frombytes(data)
         if bitlen is not None:
@@ -66,9 +198,7 @@ class BitFiFo:
         if underflow > 0:
             raise BufferError('Not enough data in the buffer, underflow by %d bits' % underflow)
         out = self.buf[0:bitlen]
-        b = bitarray(endian='little')
-        b += self.buf[bitlen:]
-        self.buf = b
+        del self.buf[0:bitlen]
         return out
 
     def pop_bytes(self, bitlen):
@@ -78,23 +208,104 @@ class BitFiFo:
     def tobytes(self):
         return self.buf.tobytes()
 
+    def copy(self):
+        out = BitFiFo.__new__(BitFiFo)
+        out.buf = self.buf.copy()
+        out.bitlen = self.bitlen
+        out.full_threshold = self.full_threshold
+        return out
+
+
+class Instrumentation:
+    """Counters and hooks observing the Keccak instances created with it (instrumentation argument).
+
+    Counters are plain attributes shared by all hash objects using the instance, copies included:
+    permutations, blocks_absorbed, bytes_squeezed, unaligned_absorbs (absorb calls made while pending input
+    does not end on a byte boundary, served by the bit shifting path) and f1600_ns (time spent in the permutation,
+    measured only if timing is True).
+    Hooks receive the live lanes, they must not modify them and must copy them to keep them:
+      - on_block(block_lanes): tuple of the lanes of each input block, before they are XORed into the state
+      - on_permute_in(lanes), on_permute_out(lanes): flat array of the 25 lanes before/after each permutation
+      - on_step(round, step, lanes): state after each step, step is 'theta', 'rho_pi', 'chi' or 'iota'
+    Hash objects created without instrumentation nor verbose use a code path without any of these checks.
+    Counters are not protected against concurrent updates from several threads.
+    """
+
+    def __init__(self, *, timing=False, on_block=None, on_permute_in=None, on_permute_out=None, on_step=None):
+        self.timing = timing
+        self.on_block = on_block
+        self.on_permute_in = on_permute_in
+        self.on_permute_out = on_permute_out
+        self.on_step = on_step
+        self.reset()
+
+    def reset(self):
+        """Set all counters to 0"""
+        self.permutations = 0
+        self.blocks_absorbed = 0
+        self.bytes_squeezed = 0
+        self.unaligned_absorbs = 0
+        self.f1600_ns = 0
+
+    def counters(self):
+        """Return the counters as a dict"""
+        return {
+            'permutations': self.permutations,
+            'blocks_absorbed': self.blocks_absorbed,
+            'bytes_squeezed': self.bytes_squeezed,
+            'unaligned_absorbs': self.unaligned_absorbs,
+            'f1600_ns': self.f1600_ns,
+        }
+
 
 class Keccak:
-    def __init__(self, capacity, suffix: str, *, verbose: bool = False):
+    # an instance takes about 600 bytes for SHA3-256: the object and its slots (128 bytes), the 25 lanes
+    # packed in an array('Q') (280 bytes) and the rate bytes block (193 bytes), parameters are shared
+    __slots__ = (
+        '_block',
+        '_instrumentation',
+        '_nbits',
+        '_offset',
+        '_round_constants',
+        '_verbose',
+        'capacity',
+        'finalized',
+        'lanes',
+        'rate',
+        'rate_bytes',
+        'suffix',
+    )
+
+    def __new__(cls, capacity=None, suffix=None, *, verbose=False, instrumentation=None, rounds=24):
+        # tracing is implemented by a subclass so that the default code path has no tracing branch
+        if cls is Keccak and (verbose or instrumentation is not None):
+            cls = _TracedKeccak
+        return super().__new__(cls)
+
+    def __init__(self, capacity, suffix: str, *, verbose: bool = False, instrumentation=None, rounds=24):
         """SHA3-Keccak implementation supporting bit granularity for message input length.
-        This implement only the variant describe in SHA3 standard.
+        This implement the sponge described in SHA3 standard: suffix bits then pad10*1.
+        rounds is the number of rounds of the Keccak-p[1600, rounds] permutation, the last ones of Keccak-f.
+        instrumentation is an optional Instrumentation collecting counters and calling hooks.
         """
         if (capacity % 8) != 0:
             raise ValueError('capacity is not a multiple of 8: %d' % capacity)
         if capacity > 1600:
             raise ValueError('capacity > 1600')
-        self.suffix = suffix
-        self.capacity = capacity
-        self.rate = 1600 - self.capacity
-        self.rate_bytes = self.rate // 8
-        self.state = [[0] * 5 for i in range(5)]
-        self.buf = BitFiFo(bitlen=self.rate + 8, full_threshold=self.rate)
+        if not 1 <= rounds <= 24:
+            raise ValueError('rounds=%d, it must be in [1, 24]' % rounds)
+        (self.capacity, self.suffix, self.rate, self.rate_bytes, self._round_constants) = _sponge_parameters(
+            capacity, suffix, rounds
+        )
+        self.lanes = array('Q', [0] * 25)
+        # pending input is made of the _offset bytes of _block followed by the _nbits (< 8) low bits of
+        # _block[_offset], its other bits are 0.
+        # Once finalized, _block holds the current output block and _offset the bytes already squeezed.
+        self._block = bytearray(self.rate_bytes)
+        self._offset = 0
+        self._nbits = 0
         self._verbose = verbose
+        self._instrumentation = instrumentation
         self.finalized = False
 
     @staticmethod
@@ -107,19 +318,37 @@ class Keccak:
         if verbose:
             logging.info('importing state:')
             logging.info('  capacity = %d' % state['capacity'])
-            logging.info('  state:  ' + Keccak._state_str(state['state']))
+            logging.info('  state:  ' + Keccak._state_str(Keccak._flatten(state['state'])))
             if state['finalized']:
                 logging.info('  finalized')
             else:
-                logging.info('  cache:  ' + Utils.hexstr(state['cache']))
+                logging.info('  cache:  ' + _utils().hexstr(state['cache']))
                 logging.info('  bitlen = %d' % state['bitlen'])
-        out = Keccak(capacity, suffix, verbose=verbose)
-        out.state = state['state']
+        out = Keccak(capacity, suffix, verbose=verbose, rounds=state.get('rounds', 24))
+        out.lanes = array('Q', Keccak._flatten(state['state']))
         out.finalized = finalized
         if finalized:
-            out.buf = state['cache']
+            out._offset = out.rate_bytes - len(state['cache'])
+            out._block[out._offset :] = state['cache']
         else:
-            out.buf.push_bytes(state['cache'], state['bitlen'])
+            out.absorb(state['cache'], state['bitlen'])
+        return out
+
+    def copy(self):
+        """Return a copy of the sponge, only the lanes and the pending input are duplicated"""
+        out = object.__new__(type(self))
+        out.suffix = self.suffix
+        out.capacity = self.capacity
+        out.rate = self.rate
+        out.rate_bytes = self.rate_bytes
+        out._round_constants = self._round_constants
+        out.lanes = self.lanes[:]
+        out._block = bytearray(self._block)
+        out._offset = self._offset
+        out._nbits = self._nbits
+        out._verbose = self._verbose
+        out._instrumentation = self._instrumentation
+        out.finalized = self.finalized
         return out
 
     def export_state(self):
@@ -128,168 +357,438 @@ class Keccak:
         state['verbose'] = self._verbose
         state['capacity'] = self.capacity
         state['suffix'] = self.suffix
+        state['rounds'] = len(self._round_constants)
         state['finalized'] = self.finalized
-        state['state'] = self.state
+        state['state'] = Keccak._unflatten(self.lanes)
         if state['finalized']:
-            state['cache'] = self.buf
+            state['cache'] = bytes(self._block[self._offset :])
         else:
-            state['cache'] = self.buf.tobytes()
-            state['bitlen'] = self.buf.level()
+            pending, state['bitlen'] = self._pending_input()
+            state['cache'] = bytes(pending)
         if self._verbose:
             logging.info('exporting current state:')
             logging.info('  capacity = %d' % state['capacity'])
-            logging.info('  state:  ' + Keccak._state_str(self.state))
-            logging.info('  cache:  ' + Utils.hexstr(state['cache']))
-            if state['finalized'] is None:
+            logging.info('  state:  ' + Keccak._state_str(self.lanes))
+            logging.info('  cache:  ' + _utils().hexstr(state['cache']))
+            if state['finalized']:
                 logging.info('  finalized')
             else:
                 logging.info('  bitlen = %d' % state['bitlen'])
         return state
 
-    def _process_block(self, block):
-        nlanes = self.rate_bytes // 8
-        input_bytes = bytearray(self.rate_bytes)
-        input_bytes[0 : len(block)] = block
-        input_lanes = [[0] * 5 for i in range(5)]
-        for i in range(nlanes):
-            lane = int.from_bytes(input_bytes[i * 8 : i * 8 + 8], byteorder='little')
-            y = i // 5
-            x = i - 5 * y
-            input_lanes[x][y] = lane
-            self.state[x][y] ^= lane
+    def export_state_bytes(self):
+        """Export current state to a compact binary representation.
+        It is made of a 15 bytes header (magic, version, capacity, suffix, flags, bitlen),
+        the 200 bytes of the lanes in little endian and the pending input bytes.
+        """
+        flags = _STATE_FINALIZED if self.finalized else 0
         if self._verbose:
-            logging.info('process block:\n' + Keccak._state_str(input_lanes, limit=nlanes))
-        self.state = Keccak.f1600(self.state, verbose=self._verbose)
+            flags |= _STATE_VERBOSE
+        flags |= (24 - len(self._round_constants)) << _STATE_ROUNDS_SHIFT
+        if self.finalized:
+            pending = self._block[self._offset :]
+            bitlen = len(pending) * 8
+        else:
+            pending, bitlen = self._pending_input()
+        return _pack_state(self.capacity, self.suffix, flags, self.lanes, pending, bitlen)
+
+    @staticmethod
+    def import_state_bytes(data):
+        """Initialize an instance from the output of export_state_bytes.
+        data can be any object supporting the buffer protocol, it is parsed in place.
+        """
+        with memoryview(data) as view, view.cast('B') as data:
+            capacity, suffix, flags, bitlen, lanes_offset, pending_offset = _unpack_state(data)
+            if flags & _STATE_DIGEST:
+                raise ValueError('serialized state holds only a digest')
+            rounds = 24 - (flags >> _STATE_ROUNDS_SHIFT)
+            out = Keccak(capacity, suffix, verbose=bool(flags & _STATE_VERBOSE), rounds=rounds)
+            out.lanes = array('Q', _lanes_struct(25).unpack_from(data, lanes_offset))
+            with data[pending_offset : pending_offset + (bitlen + 7) // 8] as pending:
+                if flags & _STATE_FINALIZED:
+                    out._offset = out.rate_bytes - len(pending)
+                    out._block[out._offset :] = pending
+                    out.finalized = True
+                else:
+                    out.absorb(pending, bitlen)
+        return out
+
+    def _pending_input(self):
+        """Return the input not absorbed yet as a bytearray and its length in bits"""
+        return self._block[0 : self._offset + (1 if self._nbits else 0)], self._offset * 8 + self._nbits
+
+    def _process_block(self, data, offset=0):
+        """XOR the rate_bytes bytes found at offset in data into the state and permute it."""
+        block_lanes = _lanes_struct(self.rate_bytes // 8).unpack_from(data, offset)
+        lanes = self.lanes
+        lanes[0 : len(block_lanes)] = array('Q', map(operator.xor, lanes, block_lanes))
+        Keccak._f1600(lanes, self._round_constants)
 
     def absorb(self, data, bitlen=None):
         """Update the sponge object with the bytes in data. Repeated calls
         are equivalent to a single call with the concatenation of all
         the arguments.
+        data can be any object supporting the buffer protocol, it is read in place.
+        data can also be a bitarray, bitlen is then its length by default.
         """
-        if not data:
+        if data is None:
             return
-        if bitlen is None:
-            bitlen = len(data) * 8
-        if not self.buf.empty():
-            to_consume = min(bitlen, self.buf.remaining_before_full())
-            data = self.buf.push_consume_bytes(data, to_consume)
-            bitlen -= to_consume
-            if self.buf.full():
-                r = self.buf.pop_bytes(self.rate)
-                self._process_block(r)
-        while bitlen >= self.rate:  # process all full blocks directly from input
-            # assert self.buf.empty() # valid assertion but we remove it to please RUFF linter
-            self._process_block(data[0 : self.rate_bytes])
-            bitlen -= self.rate
-            data = data[self.rate_bytes :]
-        if bitlen > 0:  # last block is a partial block, buffer it
-            self.buf.push_bytes(data, bitlen)
+        if self.finalized:
+            raise Exception('Already finalized')
+        if hasattr(data, 'endian'):
+            data, bitlen = _bitarray_input(data, bitlen)
+        with memoryview(data) as view, view.cast('B') as data:
+            if bitlen is None:
+                bitlen = len(data) * 8
+            elif bitlen > len(data) * 8:
+                raise ValueError('bitlen=%d but data has only %d bits' % (bitlen, len(data) * 8))
+            if not bitlen:
+                return
+            if self._nbits:
+                self._absorb_shifted(data, bitlen)
+                return
+            nbytes = bitlen // 8
+            self._absorb_bytes(data, nbytes)
+            if bitlen % 8:  # keep the trailing bits, next input is shifted to follow them
+                self._nbits = bitlen % 8
+                self._block[self._offset] = data[nbytes] & ((1 << self._nbits) - 1)
+
+    def _absorb_bytes(self, data, bytelen):
+        """Absorb bytelen bytes of data while pending input is byte aligned."""
+        rate_bytes = self.rate_bytes
+        block = self._block
+        offset = self._offset
+        pos = 0
+        if offset:
+            pos = min(bytelen, rate_bytes - offset)
+            block[offset : offset + pos] = data[0:pos]
+            offset += pos
+            if offset == rate_bytes:
+                self._process_block(block)
+                offset = 0
+        while bytelen - pos >= rate_bytes:  # process all full blocks directly from input
+            self._process_block(data, pos)
+            pos += rate_bytes
+        if pos < bytelen:  # last block is a partial block, buffer it
+            block[offset : offset + bytelen - pos] = data[pos:bytelen]
+            offset += bytelen - pos
+        self._offset = offset
+
+    def _absorb_shifted(self, data, bitlen):
+        """Absorb bitlen bits of data while _nbits bits are pending.
+        Input is shifted to follow the pending bits by slices, one big int shift per slice,
+        and the shifted bytes are absorbed like byte aligned input.
+        """
+        nbits = self._nbits
+        carry = self._block[self._offset]
+        nbytes = bitlen // 8
+        for pos in range(0, nbytes, _SHIFT_SLICE):
+            n = min(_SHIFT_SLICE, nbytes - pos)
+            v = (int.from_bytes(data[pos : pos + n], 'little') << nbits) | carry
+            self._absorb_bytes(v.to_bytes(n + 1, 'little'), n)
+            carry = v >> (8 * n)
+        if bitlen % 8:
+            carry |= (data[nbytes] & ((1 << (bitlen % 8)) - 1)) << nbits
+            nbits += bitlen % 8
+            if nbits >= 8:
+                self._absorb_bytes(bytes([carry & 0xFF]), 1)
+                carry >>= 8
+                nbits -= 8
+        self._block[self._offset] = carry
+        self._nbits = nbits
 
     def _finalize(self) -> None:
         if self.finalized:
             raise Exception('Already finalized')
-        self.buf.push(bitarray(self.suffix, endian='little'))
-        if self.buf.full():
-            r = self.buf.pop_bytes(self.rate)
-            self._process_block(r)
-        data = self.buf.tobytes()
-        block = bytearray(self.rate_bytes)
-        block[0 : len(data)] = data
-        block[-1] ^= 0x80
-        self._process_block(block)
+        # pending bits, suffix and the final bit of the padding, which may need one more block
+        rate_bytes = self.rate_bytes
+        tail = (self._block[self._offset] if self._nbits else 0) | (
+            (int(self.suffix[::-1], 2) if self.suffix else 0) << self._nbits
+        )
+        tail_bits = self._nbits + len(self.suffix)
+        end = self._offset * 8 + tail_bits
+        block = self._block
+        if end < self.rate:
+            block[self._offset :] = bytes(rate_bytes - self._offset)
+        else:
+            block = block[0 : self._offset] + bytes((end // self.rate + 1) * rate_bytes - self._offset)
+        block[self._offset : self._offset + (tail_bits + 7) // 8] = tail.to_bytes((tail_bits + 7) // 8, 'little')
+        block[-1] |= 0x80
+        for pos in range(0, len(block), rate_bytes):
+            self._process_block(block, pos)
+        self._nbits = 0
         self._format_output()
         self.finalized = True
 
+    def _permute(self):
+        Keccak._f1600(self.lanes, self._round_constants)
+
     def _format_output(self):
-        buf = bytearray()
+        """Write the output block in _block, _offset counts the output bytes already consumed."""
         nlanes = self.rate_bytes // 8
-        for i in range(nlanes):
-            y = i // 5
-            x = i - 5 * y
-            buf += self.state[x][y].to_bytes(8, byteorder='little')
-        self.buf = buf
+        _lanes_struct(nlanes).pack_into(self._block, 0, *self.lanes[0:nlanes])
+        self._offset = 0
 
     def squeez(self, bytelen):
         """Squeez the sponge."""
+        out = bytearray(bytelen)
+        self.squeeze_into(out)
+        return out
+
+    def squeeze_into(self, buffer):
+        """Squeez the sponge directly into buffer, filling it entirely.
+        buffer can be any writable object supporting the buffer protocol (bytearray, memoryview, mmap...).
+        Return the number of bytes written.
+        """
         if not self.finalized:
             self._finalize()
-        out = bytearray()
-        remaining = bytelen
-        while remaining > 0:
-            if 0 == len(self.buf):
-                self.state = Keccak.f1600(self.state, verbose=self._verbose)
+        rate_bytes = self.rate_bytes
+        nlanes = rate_bytes // 8
+        block = self._block
+        with memoryview(buffer) as view, view.cast('B') as out:
+            n = len(out)
+            pos = min(n, rate_bytes - self._offset)
+            out[0:pos] = block[self._offset : self._offset + pos]
+            self._offset += pos
+            lanes_struct = _lanes_struct(nlanes)
+            while n - pos >= rate_bytes:  # full blocks are written directly from the lanes
+                self._permute()
+                lanes_struct.pack_into(out, pos, *self.lanes[0:nlanes])
+                pos += rate_bytes
+            if pos < n:  # last block is a partial block, keep the rest of it for next call
+                self._permute()
                 self._format_output()
-            size = min(remaining, len(self.buf))
-            out += self.buf[0:size]
-            self.buf = self.buf[size:]
-            remaining -= size
-        return out
+                out[pos:n] = block[0 : n - pos]
+                self._offset = n - pos
+        return n
 
     @staticmethod
     def _rol64(a, n):
         return ((a >> (64 - (n % 64))) + (a << (n % 64))) % (1 << 64)
 
     @staticmethod
-    def f1600(lanes, *, verbose: bool = False) -> None:
-        """SHA3 f function. lanes must be a list of 5 list of 5 int."""
+    def _flatten(lanes):
+        """Convert a list of 5 list of 5 int (lanes[x][y]) into a flat list of 25 lanes."""
+        return [lanes[x][y] for y in range(5) for x in range(5)]
+
+    @staticmethod
+    def _unflatten(lanes):
+        """Convert a flat list of 25 lanes into a list of 5 list of 5 int (lanes[x][y])."""
+        return [[lanes[x + 5 * y] for y in range(5)] for x in range(5)]
+
+    @staticmethod
+    def f1600(lanes, *, verbose: bool = False, rounds=24):
+        """SHA3 f function, Keccak-p[1600, rounds] if rounds is less than 24.
+        lanes must be a list of 5 list of 5 int.
+        """
+        if not 1 <= rounds <= 24:
+            raise ValueError('rounds=%d, it must be in [1, 24]' % rounds)
+        flat = Keccak._flatten(lanes)
         if verbose:
-            logging.info('f1600 input:\n' + Keccak._state_str(lanes))
+            Keccak._f1600_verbose(flat, _ROUND_CONSTANTS[24 - rounds :])
+        else:
+            Keccak._f1600(flat, _ROUND_CONSTANTS[24 - rounds :])
+        return Keccak._unflatten(flat)
+
+    @staticmethod
+    def _f1600(lanes, round_constants=_ROUND_CONSTANTS) -> None:
+        """SHA3 f function, in place on a flat list or array('Q') of 25 lanes (lane x, y at index x + 5 * y).
+        The 5 steps are fused and unrolled, rotation offsets and π destinations
+        are those from _RHO_OFFSETS and _PI_LANES.
+        round_constants are those of the rounds to apply, the last ones of _ROUND_CONSTANTS for Keccak-p.
+        """
+        mask = _MASK64
+        (
+            a0, a1, a2, a3, a4,
+            a5, a6, a7, a8, a9,
+            a10, a11, a12, a13, a14,
+            a15, a16, a17, a18, a19,
+            a20, a21, a22, a23, a24,
+        ) = lanes  # fmt: skip
+        for rc in round_constants:
+            c0 = a0 ^ a5 ^ a10 ^ a15 ^ a20
+            c1 = a1 ^ a6 ^ a11 ^ a16 ^ a21
+            c2 = a2 ^ a7 ^ a12 ^ a17 ^ a22
+            c3 = a3 ^ a8 ^ a13 ^ a18 ^ a23
+            c4 = a4 ^ a9 ^ a14 ^ a19 ^ a24
+            d0 = c4 ^ (((c1 << 1) | (c1 >> 63)) & mask)
+            d1 = c0 ^ (((c2 << 1) | (c2 >> 63)) & mask)
+            d2 = c1 ^ (((c3 << 1) | (c3 >> 63)) & mask)
+            d3 = c2 ^ (((c4 << 1) | (c4 >> 63)) & mask)
+            d4 = c3 ^ (((c0 << 1) | (c0 >> 63)) & mask)
+            b0 = a0 ^ d0
+            t = a1 ^ d1
+            b10 = ((t << 1) | (t >> 63)) & mask
+            t = a2 ^ d2
+            b20 = ((t << 62) | (t >> 2)) & mask
+            t = a3 ^ d3
+            b5 = ((t << 28) | (t >> 36)) & mask
+            t = a4 ^ d4
+            b15 = ((t << 27) | (t >> 37)) & mask
+            t = a5 ^ d0
+            b16 = ((t << 36) | (t >> 28)) & mask
+            t = a6 ^ d1
+            b1 = ((t << 44) | (t >> 20)) & mask
+            t = a7 ^ d2
+            b11 = ((t << 6) | (t >> 58)) & mask
+            t = a8 ^ d3
+            b21 = ((t << 55) | (t >> 9)) & mask
+            t = a9 ^ d4
+            b6 = ((t << 20) | (t >> 44)) & mask
+            t = a10 ^ d0
+            b7 = ((t << 3) | (t >> 61)) & mask
+            t = a11 ^ d1
+            b17 = ((t << 10) | (t >> 54)) & mask
+            t = a12 ^ d2
+            b2 = ((t << 43) | (t >> 21)) & mask
+            t = a13 ^ d3
+            b12 = ((t << 25) | (t >> 39)) & mask
+            t = a14 ^ d4
+            b22 = ((t << 39) | (t >> 25)) & mask
+            t = a15 ^ d0
+            b23 = ((t << 41) | (t >> 23)) & mask
+            t = a16 ^ d1
+            b8 = ((t << 45) | (t >> 19)) & mask
+            t = a17 ^ d2
+            b18 = ((t << 15) | (t >> 49)) & mask
+            t = a18 ^ d3
+            b3 = ((t << 21) | (t >> 43)) & mask
+            t = a19 ^ d4
+            b13 = ((t << 8) | (t >> 56)) & mask
+            t = a20 ^ d0
+            b14 = ((t << 18) | (t >> 46)) & mask
+            t = a21 ^ d1
+            b24 = ((t << 2) | (t >> 62)) & mask
+            t = a22 ^ d2
+            b9 = ((t << 61) | (t >> 3)) & mask
+            t = a23 ^ d3
+            b19 = ((t << 56) | (t >> 8)) & mask
+            t = a24 ^ d4
+            b4 = ((t << 14) | (t >> 50)) & mask
+            a0 = b0 ^ (~b1 & b2)
+            a1 = b1 ^ (~b2 & b3)
+            a2 = b2 ^ (~b3 & b4)
+            a3 = b3 ^ (~b4 & b0)
+            a4 = b4 ^ (~b0 & b1)
+            a5 = b5 ^ (~b6 & b7)
+            a6 = b6 ^ (~b7 & b8)
+            a7 = b7 ^ (~b8 & b9)
+            a8 = b8 ^ (~b9 & b5)
+            a9 = b9 ^ (~b5 & b6)
+            a10 = b10 ^ (~b11 & b12)
+            a11 = b11 ^ (~b12 & b13)
+            a12 = b12 ^ (~b13 & b14)
+            a13 = b13 ^ (~b14 & b10)
+            a14 = b14 ^ (~b10 & b11)
+            a15 = b15 ^ (~b16 & b17)
+            a16 = b16 ^ (~b17 & b18)
+            a17 = b17 ^ (~b18 & b19)
+            a18 = b18 ^ (~b19 & b15)
+            a19 = b19 ^ (~b15 & b16)
+            a20 = b20 ^ (~b21 & b22)
+            a21 = b21 ^ (~b22 & b23)
+            a22 = b22 ^ (~b23 & b24)
+            a23 = b23 ^ (~b24 & b20)
+            a24 = b24 ^ (~b20 & b21)
+            a0 ^= rc
+        lanes[:] = array('Q', (
+            a0, a1, a2, a3, a4,
+            a5, a6, a7, a8, a9,
+            a10, a11, a12, a13, a14,
+            a15, a16, a17, a18, a19,
+            a20, a21, a22, a23, a24,
+        ))  # fmt: skip
+
+    @staticmethod
+    def _f1600_steps(lanes, on_step, round_constants=_ROUND_CONSTANTS) -> None:
+        """Step by step SHA3 f function calling on_step(round, step, lanes) after each step,
+        in place on a flat list of 25 lanes. Rounds are numbered like in Keccak-f, from 24 - len(round_constants).
+        """
+        for _round, rc in enumerate(round_constants, 24 - len(round_constants)):
+            c = [lanes[x] ^ lanes[x + 5] ^ lanes[x + 10] ^ lanes[x + 15] ^ lanes[x + 20] for x in range(5)]
+            d = [c[(x + 4) % 5] ^ Keccak._rol64(c[(x + 1) % 5], 1) for x in range(5)]
+            for i in range(25):
+                lanes[i] ^= d[i % 5]
+            on_step(_round, 'theta', lanes)
+            b = lanes[:]
+            for i in range(25):
+                b[_PI_LANES[i]] = Keccak._rol64(lanes[i], _RHO_OFFSETS[i])
+            lanes[:] = b
+            on_step(_round, 'rho_pi', lanes)
+            for y in range(5):
+                s = lanes[5 * y : 5 * y + 5]
+                for x in range(5):
+                    lanes[x + 5 * y] = s[x] ^ ((~s[(x + 1) % 5]) & s[(x + 2) % 5])
+            on_step(_round, 'chi', lanes)
+            lanes[0] ^= rc
+            on_step(_round, 'iota', lanes)
+
+    @staticmethod
+    def _f1600_verbose(lanes, round_constants=_ROUND_CONSTANTS, on_step=None) -> None:
+        """Step by step SHA3 f function logging intermediate values, in place on a flat list of 25 lanes.
+        on_step and round_constants are used like in _f1600_steps.
+        """
+        logging.info('f1600 input:\n' + Keccak._state_str(lanes))
         r = 1
-        for _round in range(24):
+        first = 24 - len(round_constants)
+        for _ in range(7 * first):  # skip the round constant generator to the first round
+            r = ((r << 1) ^ ((r >> 7) * 0x71)) % 256
+        for _round in range(first, 24):
             # θ
-            c = [lanes[x][0] ^ lanes[x][1] ^ lanes[x][2] ^ lanes[x][3] ^ lanes[x][4] for x in range(5)]
+            c = [lanes[x] ^ lanes[x + 5] ^ lanes[x + 10] ^ lanes[x + 15] ^ lanes[x + 20] for x in range(5)]
             d = [c[(x + 4) % 5] ^ Keccak._rol64(c[(x + 1) % 5], 1) for x in range(5)]
-            lanes = [[lanes[x][y] ^ d[x] for y in range(5)] for x in range(5)]
-            if verbose:
-                logging.debug('new round\nc:  %s' % (Keccak._lane_list_str(c)))
-                logging.debug('d:  %s' % (Keccak._lane_list_str(d)))
-                logging.debug('state after round %d θ:\n%s' % (_round, Keccak._state_str(lanes)))
+            for i in range(25):
+                lanes[i] ^= d[i % 5]
+            logging.debug('new round\nc:  %s' % (Keccak._lane_list_str(c)))
+            logging.debug('d:  %s' % (Keccak._lane_list_str(d)))
+            logging.debug('state after round %d θ:\n%s' % (_round, Keccak._state_str(lanes)))
+            if on_step is not None:
+                on_step(_round, 'theta', lanes)
 
             # p and π
             (x, y) = (1, 0)
-            current = lanes[x][y]
+            current = lanes[x + 5 * y]
             for t in range(24):
                 (x, y) = (y, (2 * x + 3 * y) % 5)
-                (current, lanes[x][y]) = (lanes[x][y], Keccak._rol64(current, (t + 1) * (t + 2) // 2))
-            if verbose:
-                logging.debug('state after round %d p and π:\n%s' % (_round, Keccak._state_str(lanes)))
+                (current, lanes[x + 5 * y]) = (lanes[x + 5 * y], Keccak._rol64(current, (t + 1) * (t + 2) // 2))
+            logging.debug('state after round %d p and π:\n%s' % (_round, Keccak._state_str(lanes)))
+            if on_step is not None:
+                on_step(_round, 'rho_pi', lanes)
 
             # χ
             for y in range(5):
-                s = [lanes[x][y] for x in range(5)]
+                s = lanes[5 * y : 5 * y + 5]
                 for x in range(5):
-                    lanes[x][y] = s[x] ^ ((~s[(x + 1) % 5]) & s[(x + 2) % 5])
-            if verbose:
-                logging.debug('state after round %d χ:\n%s' % (_round, Keccak._state_str(lanes)))
+                    lanes[x + 5 * y] = s[x] ^ ((~s[(x + 1) % 5]) & s[(x + 2) % 5])
+            logging.debug('state after round %d χ:\n%s' % (_round, Keccak._state_str(lanes)))
+            if on_step is not None:
+                on_step(_round, 'chi', lanes)
 
             # i
-            if verbose:
-                logging.debug('lanes[0][0]=%s' % (Keccak._lane_str(lanes[0][0])))
+            logging.debug('lanes[0][0]=%s' % (Keccak._lane_str(lanes[0])))
             for j in range(7):
                 r = ((r << 1) ^ ((r >> 7) * 0x71)) % 256
-                if verbose:
-                    logging.debug('j=%d, r=%d' % (j, r))
+                logging.debug('j=%d, r=%d' % (j, r))
                 if r & 2:
-                    lanes[0][0] = lanes[0][0] ^ (1 << ((1 << j) - 1))
-                    if verbose:
-                        logging.debug('lanes[0][0]=%s' % (Keccak._lane_str(lanes[0][0])))
+                    lanes[0] = lanes[0] ^ (1 << ((1 << j) - 1))
+                    logging.debug('lanes[0][0]=%s' % (Keccak._lane_str(lanes[0])))
+            if on_step is not None:
+                on_step(_round, 'iota', lanes)
 
-            if verbose:
-                if _round == 23:
-                    logging.info('f1600 output:\n{}\n{}'.format(Keccak._state_str(lanes), '-' * 131))
-                else:
-                    logging.debug('state after round %d completion\n%s' % (_round, Keccak._state_str(lanes)))
-        return lanes
+            if _round == 23:
+                logging.info('f1600 output:\n{}\n{}'.format(Keccak._state_str(lanes), '-' * 131))
+            else:
+                logging.debug('state after round %d completion\n%s' % (_round, Keccak._state_str(lanes)))
 
     @staticmethod
     def _lane_str(lane):
-        return Utils.hexstr(Utils.int_to_ba(lane, width=8))
+        return _utils().hexstr(_utils().int_to_ba(lane, width=8))
 
     @staticmethod
     def _lane_list_str(lanes, lane_sep='   '):
         out = ''
         for lane in lanes:
-            out += Utils.hexstr(Utils.int_to_ba(lane, width=8)) + lane_sep
+            out += _utils().hexstr(_utils().int_to_ba(lane, width=8)) + lane_sep
         return out
 
     @staticmethod
@@ -305,23 +804,260 @@ class Keccak:
             out += lane_sep
             for y in range(5):
                 if x + 5 * y < limit:
-                    out += Keccak._lane_str(lanes[x][y]) + lane_sep
+                    out += Keccak._lane_str(lanes[x + 5 * y]) + lane_sep
+        return out
+
+
+class _TracedKeccak(Keccak):
+    """Keccak logging intermediate values (verbose) and/or feeding an Instrumentation.
+    Keccak() returns an instance of this class when one of them is enabled.
+    """
+
+    __slots__ = ()
+
+    def _process_block(self, data, offset=0):
+        block_lanes = _lanes_struct(self.rate_bytes // 8).unpack_from(data, offset)
+        instrumentation = self._instrumentation
+        if instrumentation is not None:
+            instrumentation.blocks_absorbed += 1
+            if instrumentation.on_block is not None:
+                instrumentation.on_block(block_lanes)
+        lanes = self.lanes
+        lanes[0 : len(block_lanes)] = array('Q', map(operator.xor, lanes, block_lanes))
+        if self._verbose:
+            input_lanes = list(block_lanes) + [0] * (25 - len(block_lanes))
+            logging.info('process block:\n' + Keccak._state_str(input_lanes, limit=len(block_lanes)))
+        self._permute()
+
+    def _permute(self):
+        instrumentation = self._instrumentation
+        lanes = self.lanes
+        if instrumentation is None:
+            Keccak._f1600_verbose(lanes, self._round_constants)
+            return
+        instrumentation.permutations += 1
+        if instrumentation.on_permute_in is not None:
+            instrumentation.on_permute_in(lanes)
+        if instrumentation.timing:
+            start = time.perf_counter_ns()
+        if self._verbose:
+            Keccak._f1600_verbose(lanes, self._round_constants, on_step=instrumentation.on_step)
+        elif instrumentation.on_step is not None:
+            Keccak._f1600_steps(lanes, instrumentation.on_step, self._round_constants)
+        else:
+            Keccak._f1600(lanes, self._round_constants)
+        if instrumentation.timing:
+            instrumentation.f1600_ns += time.perf_counter_ns() - start
+        if instrumentation.on_permute_out is not None:
+            instrumentation.on_permute_out(lanes)
+
+    def _absorb_shifted(self, data, bitlen):
+        if self._instrumentation is not None:
+            self._instrumentation.unaligned_absorbs += 1
+        super()._absorb_shifted(data, bitlen)
+
+    def squeeze_into(self, buffer):
+        n = super().squeeze_into(buffer)
+        if self._instrumentation is not None:
+            self._instrumentation.bytes_squeezed += n
+        return n
+
+
+HASHLIB_REPLAY_LIMIT = 1 << 20  # input kept by accelerated objects to rebuild their Keccak state
+
+
+class _HashlibSponge:
+    """Sponge computed by hashlib while the pure Python state is not needed.
+    Absorbed bytes are also kept, up to HASHLIB_REPLAY_LIMIT bytes, to rebuild the Keccak state by replaying
+    them when a non byte aligned input or an export shows up.
+    Once they are replayed, all calls go to that Keccak instance.
+    hashlib gives SHAKE output from its start only: consecutive squeezes are served from _output, an output
+    prefix which is recomputed at least twice as long when a squeeze goes beyond it.
+    """
+
+    __slots__ = (
+        '_fast',
+        '_keccak',
+        '_output',
+        '_replay',
+        '_squeezed',
+        'capacity',
+        'finalized',
+        'rate_bytes',
+        'suffix',
+    )
+
+    def __init__(self, name, capacity, suffix):
+        import hashlib  # not needed by the default hashing path, keep it out of import time
+
+        self._fast = hashlib.new(name)
+        self._keccak = None
+        self._replay = bytearray()
+        self._output = b''
+        self._squeezed = 0
+        (self.capacity, self.suffix, _, self.rate_bytes, _) = _sponge_parameters(capacity, suffix)
+        self.finalized = False
+
+    def _rebuild(self):
+        """Return a Keccak which absorbed the same input"""
+        if self._replay is None:
+            raise ValueError(
+                'Keccak state cannot be rebuilt: more than %d bytes were absorbed by hashlib' % HASHLIB_REPLAY_LIMIT
+            )
+        out = Keccak(self.capacity, self.suffix)
+        out.absorb(self._replay)
+        return out
+
+    def _python(self):
+        """Switch to the pure Python sponge and return it"""
+        if self._keccak is None:
+            self._keccak = self._exported()
+            self._fast = None
+            self._replay = None
+            self._output = b''
+        return self._keccak
+
+    def absorb(self, data, bitlen=None):
+        if self._keccak is not None:
+            self._keccak.absorb(data, bitlen)
+            return
+        if data is None:
+            return
+        if self.finalized:
+            raise Exception('Already finalized')
+        if (bitlen is not None and bitlen % 8) or hasattr(data, 'endian'):
+            self._python().absorb(data, bitlen)
+            return
+        with memoryview(data) as view, view.cast('B') as data:
+            if bitlen is not None:
+                if bitlen > len(data) * 8:
+                    raise ValueError('bitlen=%d but data has only %d bits' % (bitlen, len(data) * 8))
+                data = data[0 : bitlen // 8]
+            self._fast.update(data)
+            if self._replay is not None:
+                if len(self._replay) + len(data) > HASHLIB_REPLAY_LIMIT:
+                    self._replay = None
+                else:
+                    self._replay += data
+
+    def squeeze_into(self, buffer):
+        if self._keccak is not None:
+            return self._keccak.squeeze_into(buffer)
+        with memoryview(buffer) as view, view.cast('B') as out:
+            n = len(out)
+            start = self._squeezed
+            end = start + n
+            if self._fast.digest_size:  # SHA3: hashlib gives only the digest
+                if end > self._fast.digest_size:
+                    return self._python().squeeze_into(out)
+                out[0:n] = self._fast.digest()[start:end]
+            else:
+                if end > len(self._output):
+                    self._output = self._fast.digest(max(end, 2 * len(self._output)))
+                out[0:n] = self._output[start:end]
+        self._squeezed = end
+        self.finalized = True
+        return n
+
+    def squeez(self, bytelen):
+        out = bytearray(bytelen)
+        self.squeeze_into(out)
+        return out
+
+    def digest(self, length):
+        """Return length bytes of SHAKE output computed by hashlib, without squeezing this sponge.
+        Return None if the output needs the pure Python sponge or continues a squeeze, or for a SHA3 sponge.
+        """
+        if self._keccak is not None or self._squeezed or self._fast.digest_size:
+            return None
+        return self._fast.digest(length)
+
+    def copy(self):
+        if self._keccak is not None:
+            return self._keccak.copy()
+        out = object.__new__(_HashlibSponge)
+        out._fast = self._fast.copy()
+        out._keccak = None
+        out._replay = None if self._replay is None else bytearray(self._replay)
+        out._output = self._output
+        out._squeezed = self._squeezed
+        out.capacity = self.capacity
+        out.suffix = self.suffix
+        out.rate_bytes = self.rate_bytes
+        out.finalized = self.finalized
         return out
 
+    def _exported(self):
+        """Return a Keccak in the same state, without leaving the hashlib backend"""
+        if self._keccak is not None:
+            return self._keccak
+        keccak = self._rebuild()
+        if self._squeezed:
+            keccak.squeez(self._squeezed)
+        return keccak
+
+    def export_state(self):
+        return self._exported().export_state()
+
+    def export_state_bytes(self):
+        return self._exported().export_state_bytes()
+
+
+class XofReader(io.RawIOBase):
+    """Read only binary stream over the output of a SHAKE object, see shake_128.reader"""
+
+    def __init__(self, h, length=None):
+        super().__init__()
+        self._h = h
+        self._remaining = length
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if self.closed:
+            raise ValueError('I/O operation on closed file.')
+        with memoryview(buffer) as view, view.cast('B') as out:
+            n = len(out)
+            if self._remaining is not None:
+                n = min(n, self._remaining)
+                self._remaining -= n
+            with out[0:n] as dest:
+                return self._h.squeeze_into(dest)
+
+    def readall(self):
+        if self._remaining is None:
+            raise ValueError('output length is unbounded, read() needs a size')
+        n = self._remaining
+        self._remaining = 0
+        return bytes(self._h.squeez(n))
+
 
 class shake_128:
+    __slots__ = ('_h', '_output', '_xof', 'block_size', 'digest_size')
     _suffix = '11111'
+    _rounds = 24
     seclevel = 128
 
-    def __init__(self, m=None, *, bitlen=None, verbose=False):
+    def __init__(self, m=None, *, bitlen=None, verbose=False, instrumentation=None, accelerated=False):
         """SHAKE implementation supporting bit granularity for message input length.
         API is the same as hashlib + export_state / import_state.
+        instrumentation is an optional Instrumentation collecting counters and calling hooks.
+        accelerated=True computes the hash with hashlib while input is byte aligned, see HASHLIB_REPLAY_LIMIT.
         """
-        v = verbose and 'pysatl' in sys.modules
+        v = verbose and _tracing_available()
         capacity = self.seclevel * 2
         self.digest_size = self.seclevel // 8
         self.block_size = (1600 - capacity) // 8
-        self._h = Keccak(capacity=capacity, suffix=self._suffix, verbose=v)
+        # finalized copy of _h and its output so far, reused by digest() until the next update
+        self._xof = None
+        self._output = None
+        if accelerated and not v and instrumentation is None:
+            self._h = _HashlibSponge('shake_%d' % self.seclevel, capacity, self._suffix)
+        else:
+            self._h = Keccak(
+                capacity=capacity, suffix=self._suffix, verbose=v, instrumentation=instrumentation, rounds=self._rounds
+            )
         self.update(m, bitlen=bitlen)
 
     def export_state(self):
@@ -336,21 +1072,64 @@ class shake_128:
         o._h = Keccak.import_state(state)
         return o
 
+    def export_state_bytes(self):
+        """Export current state to bytes, see Keccak.export_state_bytes"""
+        return self._h.export_state_bytes()
+
+    @classmethod
+    def import_state_bytes(cls, data):
+        """Initialize an instance from the output of export_state_bytes"""
+        o = cls()
+        o._h = Keccak.import_state_bytes(data)
+        return o
+
+    @classmethod
+    def from_prefix(cls, prefix, *, bitlen=None, cache=None):
+        """Return a new hash object which absorbed prefix.
+        The state reached after the prefix is kept in cache (by default a PrefixCache shared by
+        all instances of the class) so next calls with the same prefix only clone it.
+        """
+        if cache is None:
+            cache = _default_prefix_cache(cls)
+        return cache.get(prefix, bitlen=bitlen)
+
     def update(self, m, *, bitlen=None):
         """Update the hash object with the bytes in m. Repeated calls
         are equivalent to a single call with the concatenation of all
         the arguments.
+        m can be any object supporting the buffer protocol (bytes, bytearray, memoryview, array, mmap...).
         """
+        self._xof = None
         self._h.absorb(m, bitlen)
 
     def digest(self, length):
         """Return the digest of the bytes passed to the update() method
         so far as a bytes object.
+        The finalized sponge and its output are kept until the next update():
+        a shorter digest is a prefix of the output, a longer one squeezes only the missing bytes.
+        hashlib computes the output of accelerated objects, they keep no cache.
         """
-        bu = copy.deepcopy(self._h)
-        out = self._h.squeez(length)
-        self._h = bu
-        return bytes(out)
+        if self._xof is None:
+            if type(self._h) is _HashlibSponge:
+                output = self._h.digest(length)
+                if output is not None:
+                    return output
+            self._xof = self._h.copy()
+            self._output = bytearray()
+        output = self._output
+        if length > len(output):
+            output += self._xof.squeez(length - len(output))
+        return bytes(output[0:length])
+
+    def copy(self):
+        """Return a copy ("clone") of the hash object. This can be used to
+        efficiently compute the digests of data sharing a common initial substring.
+        """
+        out = copy.copy(self)
+        out._h = self._h.copy()
+        out._xof = None
+        out._output = None
+        return out
 
     def hexdigest(self, length):
         """Like digest() except the digest is returned as a string
@@ -362,32 +1141,118 @@ class shake_128:
         """Squeez the sponge. Unlike digest(), consecutive calls do
         not return same values.
         """
+        self._xof = None
         return self._h.squeez(length)
 
+    def squeeze_into(self, buffer):
+        """Like squeez() except the output is written directly in buffer,
+        which is filled entirely. Return the number of bytes written.
+        """
+        self._xof = None
+        return self._h.squeeze_into(buffer)
+
     def hexsqueez(self, length):
         """Like squeez() except the bytes are returned as a string
         of double length, containing only hexadecimal digits.
         """
-        return binascii.hexlify(self.digest(length)).decode('ascii')
+        return binascii.hexlify(self.squeez(length)).decode('ascii')
+
+    def reader(self, length=None):
+        """Return a XofReader, an io.RawIOBase reading the output of the sponge like squeez().
+        length is the number of bytes before end of file, None for an endless stream.
+        Reads are served by squeeze_into, readinto() writes directly in the caller's buffer.
+        """
+        return XofReader(self, length)
+
+    def iter_blocks(self, chunk_size=None, *, length=None):
+        """Generator yielding the output of the sponge by chunks of chunk_size bytes (block_size by default).
+        length is the total output length, None for an endless output.
+        Each chunk is a new bytearray, squeezed when the consumer asks for it.
+        """
+        if chunk_size is None:
+            chunk_size = self.block_size
+        while length is None or length > 0:
+            n = chunk_size if length is None else min(chunk_size, length)
+            chunk = bytearray(n)
+            self.squeeze_into(chunk)
+            if length is not None:
+                length -= n
+            yield chunk
 
 
 class shake_256(shake_128):
+    __slots__ = ()
+    seclevel = 256
+
+
+def _left_encode(x):
+    """left_encode from NIST SP 800-185: byte length of x followed by x in big endian"""
+    n = max((x.bit_length() + 7) // 8, 1)
+    return bytes([n]) + x.to_bytes(n, 'big')
+
+
+def _right_encode(x):
+    """right_encode from NIST SP 800-185: x in big endian followed by its byte length"""
+    n = max((x.bit_length() + 7) // 8, 1)
+    return x.to_bytes(n, 'big') + bytes([n])
+
+
+def _encode_string(s):
+    """encode_string from NIST SP 800-185, for byte strings"""
+    return _left_encode(len(s) * 8) + bytes(s)
+
+
+def _bytepad(x, w):
+    """bytepad from NIST SP 800-185: left_encode(w) || x padded with zeros to a multiple of w bytes"""
+    z = _left_encode(w) + x
+    return z + bytes(-len(z) % w)
+
+
+class cshake_128(shake_128):
+    __slots__ = ('_suffix',)
+
+    def __init__(
+        self, m=None, *, bitlen=None, function_name=b'', customization=b'', verbose=False, instrumentation=None
+    ):
+        """cSHAKE (NIST SP 800-185) supporting bit granularity for message input length.
+        function_name (N) and customization (S) are byte strings, when both are empty this is SHAKE.
+        API is the same as shake_128.
+        """
+        framed = bool(function_name or customization)
+        self._suffix = '001' if framed else '11111'  # framed: '00' and the first bit of the padding
+        super().__init__(verbose=verbose, instrumentation=instrumentation)
+        if framed:
+            prefix = _encode_string(function_name) + _encode_string(customization)
+            self._h.absorb(_bytepad(prefix, self.block_size))
+        self.update(m, bitlen=bitlen)
+
+
+class cshake_256(cshake_128):
+    __slots__ = ()
     seclevel = 256
 
 
 class sha3_224:
+    __slots__ = ('_digest', '_h', '_verbose', 'block_size', 'digest_size')
     _suffix = '011'
     seclevel = 224
 
-    def __init__(self, m=None, *, bitlen=None, verbose=False):
+    def __init__(self, m=None, *, bitlen=None, verbose=False, instrumentation=None, accelerated=False):
         """SHA3 implementation supporting bit granularity for message input length.
         API is the same as hashlib + export_state / import_state.
+        instrumentation is an optional Instrumentation collecting counters and calling hooks.
+        accelerated=True computes the hash with hashlib while input is byte aligned, see HASHLIB_REPLAY_LIMIT.
         """
         capacity = self.seclevel * 2
         self.digest_size = self.seclevel // 8
         self.block_size = (1600 - capacity) // 8
-        self._verbose = verbose and 'pysatl' in sys.modules
-        self._h = Keccak(capacity=capacity, suffix=self._suffix, verbose=self._verbose)
+        self._verbose = verbose and _tracing_available()
+        if accelerated and not self._verbose and instrumentation is None:
+            self._h = _HashlibSponge('sha3_%d' % self.seclevel, capacity, self._suffix)
+        else:
+            self._h = Keccak(
+                capacity=capacity, suffix=self._suffix, verbose=self._verbose, instrumentation=instrumentation
+            )
         self._digest = None
         self.update(m, bitlen=bitlen)
 
@@ -405,7 +1270,7 @@ class sha3_224:
             out['verbose'] = self._verbose
             if self._verbose:
                 logging.info('exporting finalized digest:')
-                logging.info('  digest:  ' + Utils.hexstr(digest))
+                logging.info('  digest:  ' + _utils().hexstr(digest))
         return out
 
     @classmethod
@@ -418,15 +1283,49 @@ class sha3_224:
             o._h = None
             if o._verbose:
                 logging.info('importing finalized digest:')
-                logging.info('  digest:  ' + Utils.hexstr(o._digest))
+                logging.info('  digest:  ' + _utils().hexstr(o._digest))
         else:
             o._h = Keccak.import_state(state)
         return o
 
+    def export_state_bytes(self):
+        """Export current state to bytes, see Keccak.export_state_bytes"""
+        if self._digest is None:
+            return self._h.export_state_bytes()
+        flags = _STATE_FINALIZED | _STATE_DIGEST
+        if self._verbose:
+            flags |= _STATE_VERBOSE
+        return _pack_state(self.seclevel * 2, self._suffix, flags, [0] * 25, self._digest, len(self._digest) * 8)
+
+    @classmethod
+    def import_state_bytes(cls, data):
+        """Initialize an instance from the output of export_state_bytes"""
+        o = cls()
+        with memoryview(data) as view, view.cast('B') as data:
+            _, _, flags, bitlen, _, pending_offset = _unpack_state(data)
+            o._verbose = bool(flags & _STATE_VERBOSE)
+            if flags & _STATE_DIGEST:
+                o._digest = bytes(data[pending_offset : pending_offset + bitlen // 8])
+                o._h = None
+            else:
+                o._h = Keccak.import_state_bytes(data)
+        return o
+
+    @classmethod
+    def from_prefix(cls, prefix, *, bitlen=None, cache=None):
+        """Return a new hash object which absorbed prefix.
+        The state reached after the prefix is kept in cache (by default a PrefixCache shared by
+        all instances of the class) so next calls with the same prefix only clone it.
+        """
+        if cache is None:
+            cache = _default_prefix_cache(cls)
+        return cache.get(prefix, bitlen=bitlen)
+
     def update(self, m, *, bitlen=None):
         """Update the hash object with the bytes in m. Repeated calls
         are equivalent to a single call with the concatenation of all
         the arguments.
+        m can be any object supporting the buffer protocol (bytes, bytearray, memoryview, array, mmap...).
         """
         self._h.absorb(m, bitlen)
 
@@ -439,12 +1338,21 @@ class sha3_224:
 
         self._digest = self._h.squeez(self.digest_size)
         if self._verbose:
-            logging.info('digest: ' + Utils.hexstr(self._digest))
+            logging.info('digest: ' + _utils().hexstr(self._digest))
 
         self._h = None
 
         return self._digest
 
+    def copy(self):
+        """Return a copy ("clone") of the hash object. This can be used to
+        efficiently compute the digests of data sharing a common initial substring.
+        """
+        out = copy.copy(self)
+        if self._h is not None:
+            out._h = self._h.copy()
+        return out
+
     def hexdigest(self):
         """Like digest() except the digest is returned as a string
         of double length, containing only hexadecimal digits.
@@ -453,14 +1361,17 @@ class sha3_224:
 
 
 class sha3_256(sha3_224):
+    __slots__ = ()
     seclevel = 256
 
 
 class sha3_384(sha3_224):
+    __slots__ = ()
     seclevel = 384
 
 
 class sha3_512(sha3_224):
+    __slots__ = ()
     seclevel = 512
 
 
@@ -482,3 +1393,955 @@ def sha3(seclevel):
     if 512 == seclevel:
         return sha3_512
     raise ValueError('seclevel=%d, it must be in [244, 256, 384, 512]' % seclevel)
+
+
+def cshake(seclevel):
+    if 128 == seclevel:
+        return cshake_128
+    if 256 == seclevel:
+        return cshake_256
+    raise ValueError('seclevel=%d, it must be in [128, 256]' % seclevel)
+
+
+_LEAF_GROUP_BYTES = 1 << 20  # leaves are dispatched by groups of about this size
+_LEAF_GROUP_MAX_PENDING = 16  # groups dispatched to an executor and not collected yet
+
+
+class _LeafGroups:
+    """Leaves of a tree hash (ParallelHash, KangarooTwelve) hashed by groups with hash_leaves(leaves, seclevel),
+    which returns their concatenated outputs. A group is hashed as soon as it is complete: in executor if given,
+    in the calling thread otherwise. Outputs are absorbed in order by the hash object given to add().
+    """
+
+    __slots__ = ('_executor', '_futures', '_group_size', '_hash_leaves', '_leaves', '_seclevel', 'count')
+
+    def __init__(self, hash_leaves, seclevel, leaf_size, executor):
+        self._hash_leaves = hash_leaves
+        self._seclevel = seclevel
+        self._executor = executor
+        self._group_size = max(_LEAF_GROUP_BYTES // leaf_size, 1)
+        self._futures = collections.deque()  # outputs of the groups sent to executor, in order
+        self._leaves = []  # complete leaves not dispatched yet
+        self.count = 0  # number of dispatched leaves
+
+    def add(self, h, leaf):
+        """Add a complete leaf, h absorbs the outputs of the groups hashed so far"""
+        self._leaves.append(leaf)
+        if len(self._leaves) >= self._group_size:
+            self._dispatch(h)
+
+    def _dispatch(self, h):
+        leaves = self._leaves
+        self._leaves = []
+        self.count += len(leaves)
+        if self._executor is None:
+            h.update(self._hash_leaves(leaves, self._seclevel))
+            return
+        futures = self._futures
+        futures.append(self._executor.submit(self._hash_leaves, leaves, self._seclevel))
+        # absorb the outputs available in order, wait for the oldest ones if too many groups are in flight
+        while futures and (len(futures) > _LEAF_GROUP_MAX_PENDING or futures[0].done()):
+            h.update(futures.popleft().result())
+
+    def finish(self, h, last=()):
+        """Absorb in h the outputs of all the leaves followed by the outputs of the last leaves,
+        without changing this object. Return the total number of leaves.
+        """
+        for future in self._futures:
+            h.update(future.result())
+        leaves = [*self._leaves, *last]
+        if leaves:
+            h.update(self._hash_leaves(leaves, self._seclevel))
+        return self.count + len(leaves)
+
+    def pending(self):
+        """Return True if some outputs were not absorbed yet"""
+        return bool(self._futures or self._leaves)
+
+    def copy(self):
+        """Return a copy sharing the groups being hashed"""
+        out = copy.copy(self)
+        out._futures = collections.deque(self._futures)
+        out._leaves = self._leaves[:]
+        return out
+
+
+def _length_encode(x):
+    """length_encode from RFC 9861: x in big endian on as few bytes as possible followed by their count,
+    0 is encoded as a single 0 byte
+    """
+    n = (x.bit_length() + 7) // 8
+    return x.to_bytes(n, 'big') + bytes([n])
+
+
+class turboshake_128(shake_128):
+    __slots__ = ('_suffix',)
+    _rounds = 12
+
+    def __init__(self, m=None, *, bitlen=None, domain=0x1F, verbose=False, instrumentation=None):
+        """TurboSHAKE (RFC 9861): SHAKE on Keccak-p[1600, 12] with a domain separation byte in [0x01, 0x7F].
+        Input is a byte string: bitlen, if given, must be a multiple of 8.
+        API is the same as shake_128.
+        """
+        if not 0x01 <= domain <= 0x7F:
+            raise ValueError('domain=0x%02X, it must be in [0x01, 0x7F]' % domain)
+        self._suffix = format(domain, 'b')[::-1]  # bits of the domain byte up to the first bit of the padding
+        super().__init__(verbose=verbose, instrumentation=instrumentation)
+        self.update(m, bitlen=bitlen)
+
+    def update(self, m, *, bitlen=None):
+        """Update the hash object with the bytes in m, see shake_128.update"""
+        if bitlen is not None and bitlen % 8:
+            raise ValueError('TurboSHAKE input is made of bytes, bitlen=%d' % bitlen)
+        super().update(m, bitlen=bitlen)
+
+
+class turboshake_256(turboshake_128):
+    __slots__ = ()
+    seclevel = 256
+
+
+def turboshake(seclevel):
+    if 128 == seclevel:
+        return turboshake_128
+    if 256 == seclevel:
+        return turboshake_256
+    raise ValueError('seclevel=%d, it must be in [128, 256]' % seclevel)
+
+
+_KT_CHUNK_SIZE = 8192
+_KT_DOMAIN_SINGLE = 0x07  # S fits in a single chunk
+_KT_DOMAIN_LEAF = 0x0B
+_KT_DOMAIN_FINAL = 0x06  # final node of the tree
+
+
+def _kt_leaves(leaves, seclevel):
+    """Return the concatenated chaining values of KangarooTwelve leaves: TurboSHAKE with domain 0x0B on
+    2 * seclevel bits. Several leaves are hashed at once by the batch engine when NumPy is available.
+    """
+    outlen = seclevel // 4
+    if len(leaves) > 1:
+        try:
+            from sha3bit import batch
+        except ImportError:
+            pass
+        else:
+            suffix = format(_KT_DOMAIN_LEAF, 'b')[::-1]
+            return b''.join(batch.keccak_many(leaves, seclevel * 2, suffix, outlen, rounds=12))
+    cls = turboshake(seclevel)
+    return b''.join(cls(leaf, domain=_KT_DOMAIN_LEAF).digest(outlen) for leaf in leaves)
+
+
+class kangarootwelve_128:
+    __slots__ = ('_leaf_groups', '_node', '_pending', '_xof', 'block_size', 'customization', 'digest_size')
+    seclevel = 128
+
+    def __init__(self, m=None, *, customization=b'', executor=None):
+        """KangarooTwelve (RFC 9861): KT128, or KT256 for kangarootwelve_256.
+        Once the input exceeds a chunk of 8192 bytes, update() hashes the next chunks as leaves of the tree.
+        Leaves are hashed by groups, in executor if given, with the batch engine when NumPy is available.
+        API is the same as shake_128 without bit granularity.
+        """
+        self.customization = bytes(customization)
+        self.digest_size = self.seclevel // 4
+        self.block_size = (1600 - 2 * self.seclevel) // 8
+        self._leaf_groups = _LeafGroups(_kt_leaves, self.seclevel, _KT_CHUNK_SIZE, executor)
+        self._node = None  # final node, created once the input exceeds the first chunk
+        self._pending = bytearray()  # first chunk until _node exists, start of the next leaf afterwards
+        self._xof = None  # final node being squeezed
+        self.update(m)
+
+    def update(self, m):
+        """Update the hash object with the bytes in m. Repeated calls
+        are equivalent to a single call with the concatenation of all
+        the arguments.
+        m can be any object supporting the buffer protocol.
+        """
+        if m is None:
+            return
+        if self._xof is not None:
+            raise Exception('Already finalized')
+        pending = self._pending
+        with memoryview(m) as view, view.cast('B') as data:
+            pos = min(len(data), _KT_CHUNK_SIZE - len(pending))
+            pending += data[0:pos]
+            if len(pending) < _KT_CHUNK_SIZE:
+                return
+            if self._node is None:
+                # the encoded customization follows the input, so S exceeds a chunk: this is the tree mode
+                self._node = turboshake(self.seclevel)(bytes(pending) + b'\x03' + bytes(7), domain=_KT_DOMAIN_FINAL)
+            else:
+                self._leaf_groups.add(self._node, bytes(pending))
+            pending.clear()
+            while len(data) - pos >= _KT_CHUNK_SIZE:
+                self._leaf_groups.add(self._node, bytes(data[pos : pos + _KT_CHUNK_SIZE]))
+                pos += _KT_CHUNK_SIZE
+            pending += data[pos:]
+
+    def _final(self):
+        """Return the TurboSHAKE object computing the output, ready to be squeezed"""
+        if self._xof is not None:
+            return self._xof
+        cls = turboshake(self.seclevel)
+        tail = bytes(self._pending) + self.customization + _length_encode(len(self.customization))
+        node = self._node
+        if node is None:
+            if len(tail) <= _KT_CHUNK_SIZE:
+                return cls(tail, domain=_KT_DOMAIN_SINGLE)
+            node = cls(tail[0:_KT_CHUNK_SIZE] + b'\x03' + bytes(7), domain=_KT_DOMAIN_FINAL)
+            tail = tail[_KT_CHUNK_SIZE:]
+        else:
+            node = node.copy()
+        last = [tail[i : i + _KT_CHUNK_SIZE] for i in range(0, len(tail), _KT_CHUNK_SIZE)]
+        count = self._leaf_groups.finish(node, last)
+        node.update(_length_encode(count) + b'\xff\xff')
+        return node
+
+    def digest(self, length):
+        """Return length bytes of digest of the bytes passed to the update() method so far."""
+        if self._xof is not None:
+            raise Exception('Already finalized')
+        return bytes(self._final().squeez(length))
+
+    def hexdigest(self, length):
+        """Like digest() except the digest is returned as a string
+        of double length, containing only hexadecimal digits.
+        """
+        return binascii.hexlify(self.digest(length)).decode('ascii')
+
+    def squeez(self, length):
+        """Squeez the sponge. Unlike digest(), consecutive calls do
+        not return same values. update() cannot be called afterwards.
+        """
+        self._xof = self._final()
+        return self._xof.squeez(length)
+
+    def hexsqueez(self, length):
+        """Like squeez() except the bytes are returned as a string
+        of double length, containing only hexadecimal digits.
+        """
+        return binascii.hexlify(self.squeez(length)).decode('ascii')
+
+    def copy(self):
+        """Return a copy ("clone") of the hash object, sharing the groups being hashed."""
+        out = copy.copy(self)
+        out._node = None if self._node is None else self._node.copy()
+        out._leaf_groups = self._leaf_groups.copy()
+        out._pending = bytearray(self._pending)
+        out._xof = None if self._xof is None else self._xof.copy()
+        return out
+
+    def export_state(self):
+        """Export current state to a dict, leaves being hashed are collected first"""
+        node = self._node
+        count = self._leaf_groups.count
+        if node is not None and self._leaf_groups.pending():
+            node = node.copy()
+            count = self._leaf_groups.finish(node)
+        return {
+            'seclevel': self.seclevel,
+            'customization': self.customization.hex(),
+            'node': None if node is None else node.export_state(),
+            'count': count,
+            'pending': self._pending.hex(),
+            'xof': None if self._xof is None else self._xof.export_state(),
+        }
+
+    @classmethod
+    def import_state(cls, state):
+        """Initialize an instance from an exported state"""
+        o = kangarootwelve(state['seclevel'])(customization=bytes.fromhex(state['customization']))
+        tcls = turboshake(o.seclevel)
+        if state['node'] is not None:
+            o._node = tcls.import_state(state['node'])
+        o._leaf_groups.count = state['count']
+        o._pending = bytearray.fromhex(state['pending'])
+        if state['xof'] is not None:
+            o._xof = tcls.import_state(state['xof'])
+        return o
+
+
+class kangarootwelve_256(kangarootwelve_128):
+    __slots__ = ()
+    seclevel = 256
+
+
+def kangarootwelve(seclevel):
+    if 128 == seclevel:
+        return kangarootwelve_128
+    if 256 == seclevel:
+        return kangarootwelve_256
+    raise ValueError('seclevel=%d, it must be in [128, 256]' % seclevel)
+
+
+def _parallelhash_leaves(leaves, seclevel):
+    """Return the concatenated outputs of ParallelHash leaves: SHAKE (cSHAKE with empty N and S) on
+    2 * seclevel bits. Several leaves are hashed at once by the batch engine when NumPy is available.
+    """
+    outlen = seclevel // 4
+    if len(leaves) > 1:
+        try:
+            from sha3bit import batch
+        except ImportError:
+            pass
+        else:
+            return b''.join(batch.keccak_many(leaves, seclevel * 2, shake_128._suffix, outlen))
+    cls = shake(seclevel)
+    return b''.join(cls(leaf).digest(outlen) for leaf in leaves)
+
+
+class parallelhash_128:
+    __slots__ = ('_h', '_leaf_groups', '_pending', 'customization', 'digest_size', 'leaf_size')
+    seclevel = 128
+    _xof = False
+
+    def __init__(self, m=None, *, leaf_size=8192, customization=b'', executor=None):
+        """ParallelHash (NIST SP 800-185), leaf_size is the block size B in bytes.
+        update() cuts the input in leaves and hashes them by groups as soon as a group is complete:
+        in executor (for example a ProcessPoolExecutor) if given, in the calling thread otherwise.
+        Each group is hashed with the batch engine when NumPy is available.
+        API is the same as shake_128 without bit granularity, squeez and export/import.
+        """
+        if leaf_size <= 0:
+            raise ValueError('leaf_size must be positive: %d' % leaf_size)
+        self.leaf_size = leaf_size
+        self.customization = bytes(customization)
+        self.digest_size = self.seclevel // 4
+        self._leaf_groups = _LeafGroups(_parallelhash_leaves, self.seclevel, leaf_size, executor)
+        self._h = cshake(self.seclevel)(function_name=b'ParallelHash', customization=self.customization)
+        self._h.update(_left_encode(leaf_size))
+        self._pending = bytearray()  # start of the next leaf
+        self.update(m)
+
+    def update(self, m):
+        """Update the hash object with the bytes in m. Repeated calls
+        are equivalent to a single call with the concatenation of all
+        the arguments.
+        m can be any object supporting the buffer protocol.
+        """
+        if m is None:
+            return
+        leaf_size = self.leaf_size
+        pending = self._pending
+        with memoryview(m) as view, view.cast('B') as data:
+            pos = 0
+            if pending:
+                pos = min(len(data), leaf_size - len(pending))
+                pending += data[0:pos]
+                if len(pending) == leaf_size:
+                    self._leaf_groups.add(self._h, bytes(pending))
+                    pending.clear()
+            while len(data) - pos >= leaf_size:
+                self._leaf_groups.add(self._h, bytes(data[pos : pos + leaf_size]))
+                pos += leaf_size
+            pending += data[pos:]
+
+    def digest(self, length):
+        """Return length bytes of digest of the bytes passed to the update() method so far."""
+        h = self._h.copy()
+        count = self._leaf_groups.finish(h, [bytes(self._pending)] if self._pending else ())
+        h.update(_right_encode(count))
+        h.update(_right_encode(0 if self._xof else length * 8))
+        return h.digest(length)
+
+    def copy(self):
+        """Return a copy ("clone") of the hash object, sharing the groups being hashed."""
+        out = copy.copy(self)
+        out._h = self._h.copy()
+        out._leaf_groups = self._leaf_groups.copy()
+        out._pending = bytearray(self._pending)
+        return out
+
+    def hexdigest(self, length):
+        """Like digest() except the digest is returned as a string
+        of double length, containing only hexadecimal digits.
+        """
+        return binascii.hexlify(self.digest(length)).decode('ascii')
+
+
+class parallelhash_256(parallelhash_128):
+    __slots__ = ()
+    seclevel = 256
+
+
+class parallelhash_xof_128(parallelhash_128):
+    """ParallelHashXOF128, output does not depend on the requested length"""
+
+    __slots__ = ()
+    _xof = True
+
+
+class parallelhash_xof_256(parallelhash_xof_128):
+    """ParallelHashXOF256, output does not depend on the requested length"""
+
+    __slots__ = ()
+    seclevel = 256
+
+
+class hmac_sha3_224:
+    __slots__ = ('_h', '_inner', '_outer', 'block_size', 'digest_size', 'name')
+    _hash = sha3_224
+
+    def __init__(self, key, msg=None, *, bitlen=None):
+        """HMAC (FIPS 198-1) over SHA3, API is the same as the objects of the hmac module.
+        The key is absorbed once: the states reached after the inner and outer padded keys are kept,
+        copy() and mac() clone them so the MAC of a message costs no permutation of the key blocks.
+        """
+        block_size = (1600 - 2 * self._hash.seclevel) // 8
+        with memoryview(key) as view, view.cast('B') as k:
+            if len(k) > block_size:
+                k = self._hash(k).digest()
+            k = bytes(k).ljust(block_size, b'\x00')
+        self.digest_size = self._hash.seclevel // 8
+        self.block_size = block_size
+        self.name = 'hmac-' + self._hash.__name__
+        self._inner = self._hash(bytes(b ^ 0x36 for b in k))
+        self._outer = self._hash(bytes(b ^ 0x5C for b in k))
+        self._h = self._inner.copy()
+        self.update(msg, bitlen=bitlen)
+
+    def update(self, m, *, bitlen=None):
+        """Update the MAC object with the bytes in m. Repeated calls
+        are equivalent to a single call with the concatenation of all
+        the arguments.
+        """
+        self._h.update(m, bitlen=bitlen)
+
+    def _finish(self, inner):
+        outer = self._outer.copy()
+        outer.update(inner.digest())
+        return outer.digest()
+
+    def digest(self):
+        """Return the MAC of the bytes passed to the update() method so far."""
+        return self._finish(self._h.copy())
+
+    def hexdigest(self):
+        """Like digest() except the MAC is returned as a string
+        of double length, containing only hexadecimal digits.
+        """
+        return binascii.hexlify(self.digest()).decode('ascii')
+
+    def copy(self):
+        """Return a copy ("clone") of the MAC object, keyed states are shared."""
+        out = copy.copy(self)
+        out._h = self._h.copy()
+        return out
+
+    def mac(self, m, *, bitlen=None):
+        """Return the MAC of m alone under the key of this object, data passed to update() is ignored."""
+        inner = self._inner.copy()
+        inner.update(m, bitlen=bitlen)
+        return self._finish(inner)
+
+
+class hmac_sha3_256(hmac_sha3_224):
+    __slots__ = ()
+    _hash = sha3_256
+
+
+class hmac_sha3_384(hmac_sha3_224):
+    __slots__ = ()
+    _hash = sha3_384
+
+
+class hmac_sha3_512(hmac_sha3_224):
+    __slots__ = ()
+    _hash = sha3_512
+
+
+class kmac_128:
+    __slots__ = ('_h', '_keyed', 'block_size', 'digest_size')
+    seclevel = 128
+    _xof = False
+
+    def __init__(self, key, msg=None, *, customization=b'', bitlen=None):
+        """KMAC (NIST SP 800-185), the output length is given to digest().
+        bytepad(encode_string(key)) is absorbed once, copy() and mac() clone the state reached after it.
+        """
+        self.digest_size = self.seclevel // 4
+        self._keyed = cshake(self.seclevel)(function_name=b'KMAC', customization=customization)
+        self._keyed.update(_bytepad(_encode_string(key), self._keyed.block_size))
+        self.block_size = self._keyed.block_size
+        self._h = self._keyed.copy()
+        self.update(msg, bitlen=bitlen)
+
+    def update(self, m, *, bitlen=None):
+        """Update the MAC object with the bytes in m. Repeated calls
+        are equivalent to a single call with the concatenation of all
+        the arguments.
+        """
+        self._h.update(m, bitlen=bitlen)
+
+    def _finish(self, h, length):
+        h.update(_right_encode(0 if self._xof else length * 8))
+        return h.digest(length)
+
+    def digest(self, length):
+        """Return length bytes of MAC of the bytes passed to the update() method so far."""
+        return self._finish(self._h.copy(), length)
+
+    def hexdigest(self, length):
+        """Like digest() except the MAC is returned as a string
+        of double length, containing only hexadecimal digits.
+        """
+        return binascii.hexlify(self.digest(length)).decode('ascii')
+
+    def copy(self):
+        """Return a copy ("clone") of the MAC object, the keyed state is shared."""
+        out = copy.copy(self)
+        out._h = self._h.copy()
+        return out
+
+    def mac(self, m, length, *, bitlen=None):
+        """Return length bytes of MAC of m alone under the key of this object,
+        data passed to update() is ignored.
+        """
+        h = self._keyed.copy()
+        h.update(m, bitlen=bitlen)
+        return self._finish(h, length)
+
+
+class kmac_256(kmac_128):
+    __slots__ = ()
+    seclevel = 256
+
+
+class kmac_xof_128(kmac_128):
+    """KMACXOF128, output does not depend on the requested length"""
+
+    __slots__ = ()
+    _xof = True
+
+
+class kmac_xof_256(kmac_xof_128):
+    """KMACXOF256, output does not depend on the requested length"""
+
+    __slots__ = ()
+    seclevel = 256
+
+
+def _algorithm(algorithm):
+    """Return the class implementing algorithm, given as a class or a name like 'sha3_256' or 'SHAKE-128'"""
+    if not isinstance(algorithm, str):
+        return algorithm
+    name = algorithm.lower().replace('-', '_')
+    if name.startswith('shake') and '_' != name[5:6]:
+        name = 'shake_' + name[5:]
+    classes = (sha3_224, sha3_256, sha3_384, sha3_512, shake_128, shake_256, turboshake_128, turboshake_256)
+    classes = {c.__name__: c for c in classes}
+    if name not in classes:
+        raise ValueError('unsupported algorithm: %s' % algorithm)
+    return classes[name]
+
+
+def _absorb_file(h, path, bitlen, chunk_size):
+    """Feed the first bitlen bits of the file at path to h, by windows of whole blocks mapped in memory"""
+    window = max(chunk_size // h.block_size, 1) * h.block_size
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if bitlen is None:
+            bitlen = size * 8
+        if bitlen > size * 8:
+            raise ValueError('bitlen=%d but the file has only %d bits' % (bitlen, size * 8))
+        if 0 == bitlen:
+            return h
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, memoryview(mm) as view:
+            nbytes = bitlen // 8
+            for pos in range(0, nbytes, window):
+                with view[pos : min(pos + window, nbytes)] as chunk:
+                    h.update(chunk)
+            if bitlen % 8:
+                with view[nbytes : nbytes + 1] as chunk:
+                    h.update(chunk, bitlen=bitlen % 8)
+    return h
+
+
+def hash_file(path, algorithm, *, bitlen=None, chunk_size=1 << 20):
+    """Return the SHA3 digest of the file at path.
+    algorithm is one of the sha3_* classes or its name.
+    If bitlen is not None, only the first bitlen bits of the file are hashed.
+    The file is mapped in memory and absorbed by windows of chunk_size bytes rounded to whole blocks.
+    """
+    cls = _algorithm(algorithm)
+    if not issubclass(cls, sha3_224):
+        raise ValueError('%s is not a SHA3 algorithm, use shake_file' % cls.__name__)
+    return _absorb_file(cls(), path, bitlen, chunk_size).digest()
+
+
+def shake_file(path, algorithm, length, *, bitlen=None, chunk_size=1 << 20):
+    """Return length bytes of SHAKE output for the file at path.
+    algorithm is one of the shake_* classes or its name, other parameters are as in hash_file.
+    """
+    cls = _algorithm(algorithm)
+    if not issubclass(cls, shake_128):
+        raise ValueError('%s is not a SHAKE algorithm, use hash_file' % cls.__name__)
+    return _absorb_file(cls(), path, bitlen, chunk_size).digest(length)
+
+
+def _hash_one(cls, m, bitlen, outlen):
+    h = cls(m, bitlen=bitlen)
+    return h.digest() if outlen is None else h.digest(outlen)
+
+
+def _hash_range(src, dst, n, start, stop, cls, outlen, size):
+    """Hash messages start to stop of the packed input src, write their digests (size bytes each) in dst.
+    src starts with n + 1 offsets and n bit lengths as native uint64, followed by the messages.
+    """
+    header = 8 * (2 * n + 1)
+    with src[0:header] as raw, raw.cast('Q') as table:
+        for i in range(start, stop):
+            with src[header + table[i] : header + table[i + 1]] as m:
+                dst[i * size : (i + 1) * size] = _hash_one(cls, m, table[n + 1 + i], outlen)
+
+
+def _attach_shared_memory(name):
+    from multiprocessing import shared_memory
+
+    try:
+        return shared_memory.SharedMemory(name, track=False)  # the creator unlinks it
+    except TypeError:  # Python < 3.13
+        pass
+    # Attaching registers the segment with the resource tracker of the worker. A worker started before the
+    # creator's tracker has its own one, which would report a leak and unlink the segment again at exit.
+    # Unregistering is not an option: an inherited tracker is the creator's one, it would lose its entry.
+    # Skip the registration instead, like track=False.
+    from multiprocessing import resource_tracker
+
+    register = resource_tracker.register
+    resource_tracker.register = lambda name, rtype: None
+    try:
+        return shared_memory.SharedMemory(name)
+    finally:
+        resource_tracker.register = register
+
+
+def _hash_many_worker(src_name, dst_name, n, start, stop, cls, outlen, size):
+    src = _attach_shared_memory(src_name)
+    dst = _attach_shared_memory(dst_name)
+    try:
+        _hash_range(src.buf, dst.buf, n, start, stop, cls, outlen, size)
+    finally:
+        src.close()
+        dst.close()
+
+
+def hash_many(messages, algorithm, *, workers=None, outlen=None, bitlens=None, executor=None):
+    """Return the list of digests of messages, in input order, computed by a pool of workers processes.
+    algorithm is a SHA3 or SHAKE class or name, like in hash_file.
+    outlen is the output length in bytes of SHAKE, seclevel // 8 by default.
+    bitlens is None or a sequence giving the bit length of each message (None entries mean the full message).
+    workers is the number of processes (default: number of CPUs), 1 hashes in the calling process.
+    executor is an optional ProcessPoolExecutor to use instead of a new pool of workers processes.
+
+    Messages are packed in a shared memory segment behind a table of offsets and bit lengths, the workers
+    get ranges of messages of about the same size and write the digests straight in a shared output buffer:
+    nothing is pickled per message. Without multiprocessing.shared_memory (Python 3.7) the ranges of messages
+    and their digests are pickled instead.
+    """
+    cls = _algorithm(algorithm)
+    if issubclass(cls, sha3_224):
+        if outlen is not None and outlen != cls.seclevel // 8:
+            raise ValueError('outlen is %d but SHA3-%d supports only %d' % (outlen, cls.seclevel, cls.seclevel // 8))
+        size = cls.seclevel // 8
+    else:
+        if outlen is None:
+            outlen = cls.seclevel // 8
+        size = outlen
+    n = len(messages)
+    if bitlens is None:
+        bitlens = [None] * n
+    if n != len(bitlens):
+        raise ValueError('messages and bitlens must have the same length')
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if (workers <= 1 and executor is None) or n <= 1 or 0 == size:
+        return [_hash_one(cls, m, bitlen, outlen) for m, bitlen in zip(messages, bitlens)]
+
+    table = array('Q', bytes(8 * (2 * n + 1)))
+    for i, (m, bitlen) in enumerate(zip(messages, bitlens)):
+        with memoryview(m) as view:
+            nbytes = view.nbytes
+        if bitlen is None:
+            bitlen = nbytes * 8
+        elif bitlen > nbytes * 8:
+            raise ValueError('bitlen=%d but message %d has only %d bits' % (bitlen, i, nbytes * 8))
+        table[i + 1] = table[i] + (bitlen + 7) // 8
+        table[n + 1 + i] = bitlen
+
+    # contiguous ranges of messages, about 4 per worker, balanced by bytes plus one block per message
+    block_size = cls().block_size
+    target = (table[n] + n * block_size) / (4 * workers)
+    ranges = []
+    start = 0
+    for i in range(n):
+        if table[i + 1] - table[start] + (i + 1 - start) * block_size >= target:
+            ranges.append((start, i + 1))
+            start = i + 1
+    if start < n:
+        ranges.append((start, n))
+
+    import concurrent.futures
+
+    pool = executor or concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+    try:
+        try:
+            import multiprocessing.shared_memory
+        except ImportError:  # Python 3.7: each range of messages is pickled to a worker
+            futures = [
+                pool.submit(
+                    _hash_many_chunk, cls, [bytes(messages[i]) for i in range(start, stop)], bitlens[start:stop], outlen
+                )
+                for start, stop in ranges
+            ]
+            return [digest for future in futures for digest in future.result()]
+        return _hash_many_shared(multiprocessing.shared_memory, pool, messages, table, ranges, cls, outlen, size)
+    finally:
+        if executor is None:
+            pool.shutdown()
+
+
+def _hash_many_chunk(cls, messages, bitlens, outlen):
+    return [_hash_one(cls, m, bitlen, outlen) for m, bitlen in zip(messages, bitlens)]
+
+
+def _hash_many_shared(shared_memory, pool, messages, table, ranges, cls, outlen, size):
+    """Hash the ranges of messages in pool through a shared memory segment holding table and the messages"""
+    n = len(messages)
+    header = len(table) * 8
+    src = shared_memory.SharedMemory(create=True, size=header + max(table[n], 1))
+    try:
+        dst = shared_memory.SharedMemory(create=True, size=n * size)
+        try:
+            buf = src.buf
+            buf[0:header] = memoryview(table).cast('B')
+            for i, m in enumerate(messages):
+                with memoryview(m) as view, view.cast('B') as data:
+                    buf[header + table[i] : header + table[i + 1]] = data[0 : table[i + 1] - table[i]]
+            del buf
+            futures = [
+                pool.submit(_hash_many_worker, src.name, dst.name, n, start, stop, cls, outlen, size)
+                for start, stop in ranges
+            ]
+            for future in futures:
+                future.result()
+            with dst.buf[0 : n * size] as view:
+                out = bytes(view)
+        finally:
+            dst.close()
+            dst.unlink()
+    finally:
+        src.close()
+        src.unlink()
+    return [out[i * size : (i + 1) * size] for i in range(n)]
+
+
+class _HashingStream(io.BufferedIOBase):
+    """Common part of HashingWriter and HashingReader"""
+
+    def __init__(self, stream, algorithm):
+        super().__init__()
+        self.hash = _algorithm(algorithm)()
+        self._stream = stream
+        self._pos = 0
+
+    def close(self):
+        if self.closed:
+            return
+        stream = self._stream
+        try:
+            super().close()
+        finally:
+            if stream is not None:
+                stream.close()
+
+    def detach(self):
+        """Return the underlying stream, this object is closed but keeps its digest"""
+        stream = self._stream
+        super().close()
+        self._stream = None
+        return stream
+
+    def fileno(self):
+        return self._stream.fileno()
+
+    def tell(self):
+        """Return the number of bytes hashed so far"""
+        return self._pos
+
+    def digest(self, *args):
+        """Return the digest of the bytes passed through so far, SHAKE needs the output length"""
+        return self.hash.digest(*args)
+
+    def hexdigest(self, *args):
+        """Like digest() except the digest is returned as a string of hexadecimal digits"""
+        return self.hash.hexdigest(*args)
+
+
+class HashingWriter(_HashingStream):
+    def __init__(self, dest, algorithm):
+        """Binary stream writing to dest and hashing the bytes written.
+        algorithm is a SHA3 or SHAKE class or its name, like in hash_file.
+        Written buffers are absorbed in place through a memoryview, the digest is available after close,
+        which closes dest as well (use detach() to keep it open).
+        """
+        super().__init__(dest, algorithm)
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        if self.closed:
+            raise ValueError('write to closed file')
+        with memoryview(b) as view, view.cast('B') as data:
+            pos = 0
+            while pos < len(data):  # raw streams may write only a part of the buffer
+                with data[pos:] as remaining:
+                    n = self._stream.write(remaining)
+                    if n is None:  # file-like objects which do not report the count write everything
+                        n = len(remaining)
+                    with remaining[0:n] as written:
+                        self.hash.update(written)
+                self._pos += n
+                pos += n
+                if 0 == n:
+                    raise BlockingIOError(errno.EAGAIN, 'write could not complete without blocking', pos)
+        return pos
+
+    def flush(self):
+        if self._stream is not None and not self.closed:
+            self._stream.flush()
+
+
+class HashingReader(_HashingStream):
+    def __init__(self, src, algorithm):
+        """Binary stream reading from src and hashing the bytes read, in the order they are read.
+        algorithm is a SHA3 or SHAKE class or its name, like in hash_file.
+        readinto() hashes the caller's buffer in place, the digest covers the whole source once it is read to EOF.
+        Closing it closes src as well (use detach() to keep it open).
+        """
+        super().__init__(src, algorithm)
+
+    def readable(self):
+        return True
+
+    def _hashed(self, data):
+        if data is None:  # non blocking stream without data available
+            return None
+        self.hash.update(data)
+        self._pos += len(data)
+        return data
+
+    def read(self, size=-1):
+        if self.closed:
+            raise ValueError('read from closed file')
+        return self._hashed(self._stream.read(size))
+
+    def read1(self, size=-1):
+        if self.closed:
+            raise ValueError('read from closed file')
+        read1 = getattr(self._stream, 'read1', self._stream.read)
+        return self._hashed(read1(size))
+
+    def readinto(self, b):
+        if self.closed:
+            raise ValueError('read from closed file')
+        with memoryview(b) as view, view.cast('B') as out:
+            readinto = getattr(self._stream, 'readinto', None)
+            if readinto is None:
+                data = self._stream.read(len(out))
+                if data is None:
+                    return None
+                n = len(data)
+                out[0:n] = data
+            else:
+                n = readinto(out)
+                if not n:
+                    return n
+            with out[0:n] as data:
+                self._hashed(data)
+        return n
+
+    def readinto1(self, b):
+        return self.readinto(b)
+
+
+class PrefixCache:
+    def __init__(self, algorithm, *, max_entries=128, max_bytes=None):
+        """LRU cache of hash states reached after absorbing a prefix.
+        algorithm is one of the sha3_* or shake_* classes or its name.
+        Entries are keyed by the bit length and the SHA3-256 digest of the prefix, the least recently
+        used ones are dropped once there are more than max_entries or once the approximate size of the
+        cached states exceeds max_bytes.
+        """
+        self.algorithm = _algorithm(algorithm)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def _key(prefix, bitlen):
+        with memoryview(prefix) as view, view.cast('B') as data:
+            if bitlen is None:
+                bitlen = len(data) * 8
+            nbytes = bitlen // 8
+            import hashlib  # not needed by the hashing path, keep it out of import time
+
+            digest = hashlib.sha3_256(data[0:nbytes])
+            if bitlen % 8:
+                digest.update(bytes([data[nbytes] & ((1 << (bitlen % 8)) - 1)]))
+        return bitlen, digest.digest()
+
+    @staticmethod
+    def _entry_size(key, h):
+        # key, lanes and pending input block
+        return len(key[1]) + 8 + 25 * 8 + h.block_size
+
+    def get(self, prefix, *, bitlen=None):
+        """Return a new hash object which absorbed the first bitlen bits of prefix (all of it if bitlen is None)"""
+        key = PrefixCache._key(prefix, bitlen)
+        with self._lock:
+            h = self._entries.get(key)
+            if h is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return h.copy()
+            self.misses += 1
+        h = self.algorithm(prefix, bitlen=bitlen)
+        self._put(key, h)
+        return h.copy()
+
+    def _put(self, key, h):
+        size = PrefixCache._entry_size(key, h)
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = h
+            self.nbytes += size
+            while self._entries and (
+                len(self._entries) > self.max_entries or (self.max_bytes is not None and self.nbytes > self.max_bytes)
+            ):
+                old_key, old = self._entries.popitem(last=False)
+                self.nbytes -= PrefixCache._entry_size(old_key, old)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+
+_prefix_caches = {}
+
+
+def _default_prefix_cache(cls):
+    cache = _prefix_caches.get(cls)
+    if cache is None:
+        cache = _prefix_caches.setdefault(cls, PrefixCache(cls))
+    return cache
@@ -0,0 +1,109 @@
+"""asyncio front end: hash streams without blocking the event loop.
+
+Input is read from an asyncio.StreamReader (or any object with a read(n) coroutine) or from any
+async iterable of bytes-like chunks. It is coalesced into batches of whole blocks which are absorbed
+in an executor while the next batch is read. At most one batch is absorbed at a time, so a slow
+hash slows down the reads instead of buffering the stream in memory.
+
+The executor is the loop default executor unless one is given. With a thread pool the event loop
+still shares the GIL with the hashing thread, a ProcessPoolExecutor keeps it free: hash objects are
+then sent to the worker and back with each batch.
+"""
+
+import asyncio
+
+from sha3bit import _algorithm
+
+DEFAULT_BATCH_SIZE = 1 << 16
+
+
+def _update(h, data):
+    h.update(data)
+    return h
+
+
+def _digest(h, data, length):
+    h.update(data)
+    if length is None:
+        return h.digest()
+    return h.digest(length)
+
+
+def _squeez(h, bytelen):
+    return h, bytes(h.squeez(bytelen))
+
+
+async def _chunks(source, read_size):
+    """Yield the chunks of source, a stream with a read coroutine or an async iterable"""
+    read = getattr(source, 'read', None)
+    if read is None:
+        async for chunk in source:
+            yield chunk
+        return
+    while True:
+        chunk = await read(read_size)
+        if not chunk:
+            return
+        yield chunk
+
+
+async def _absorb(h, source, executor, batch_size, *, length=None, finish=False):
+    """Feed source to h by batches of whole blocks absorbed in executor.
+    If finish is True, return the digest (length bytes for SHAKE) otherwise return the updated hash object.
+    """
+    loop = asyncio.get_running_loop()
+    batch_size = max(batch_size // h.block_size, 1) * h.block_size
+    batch = bytearray()
+    pending = None  # batch being absorbed by the executor
+    async for chunk in _chunks(source, batch_size):
+        batch += chunk
+        if len(batch) < batch_size:
+            continue
+        n = len(batch) - len(batch) % h.block_size
+        data = bytes(batch[0:n])
+        del batch[0:n]
+        if pending is not None:
+            h = await pending
+        pending = loop.run_in_executor(executor, _update, h, data)
+    if pending is not None:
+        h = await pending
+    if finish:
+        return await loop.run_in_executor(executor, _digest, h, bytes(batch), length)
+    if batch:
+        h = await loop.run_in_executor(executor, _update, h, bytes(batch))
+    return h
+
+
+async def absorb_stream(h, source, *, executor=None, batch_size=DEFAULT_BATCH_SIZE):
+    """Update the hash object h with all the data of source.
+    Return the updated hash object: with a process executor it is a new object which must be used instead of h.
+    """
+    return await _absorb(h, source, executor, batch_size)
+
+
+async def hash_stream(source, algorithm, *, executor=None, batch_size=DEFAULT_BATCH_SIZE):
+    """Return the digest of all the data of source.
+    algorithm is a SHA3 class or name, like in sha3bit.hash_file.
+    """
+    return await _absorb(_algorithm(algorithm)(), source, executor, batch_size, finish=True)
+
+
+async def shake_stream(source, algorithm, length, *, executor=None, batch_size=DEFAULT_BATCH_SIZE):
+    """Return length bytes of output of a SHAKE algorithm fed with all the data of source.
+    algorithm is a SHAKE class or name, like in sha3bit.shake_file.
+    """
+    return await _absorb(_algorithm(algorithm)(), source, executor, batch_size, length=length, finish=True)
+
+
+async def squeeze_stream(h, chunk_size=DEFAULT_BATCH_SIZE, *, length=None, executor=None):
+    """Async generator yielding the output of the SHAKE object h by chunks of chunk_size bytes.
+    length is the total output length, None for an endless output.
+    Each chunk is squeezed in the executor when the consumer asks for it.
+    """
+    loop = asyncio.get_running_loop()
+    while length is None or length > 0:
+        n = chunk_size if length is None else min(chunk_size, length)
+        h, chunk = await loop.run_in_executor(executor, _squeez, h, n)
+        if length is not None:
+            length -= n
+        yield chunk
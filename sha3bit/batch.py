@@ -0,0 +1,154 @@
+"""Batch hashing of many independent messages with NumPy.
+
+The states of all messages are stacked and permuted together, one uint64 per lane,
+so the Python overhead of Keccak-f[1600] is paid once per block index instead of
+once per message and per block.
+Results are identical to the scalar classes, including for bit granular messages.
+This module requires numpy.
+"""
+import numpy as np
+
+from sha3bit import _PI_LANES, _RHO_OFFSETS, _ROUND_CONSTANTS
+
+_RHO = np.array(_RHO_OFFSETS, dtype=np.uint64)
+_RHO_COMPLEMENT = np.array([(64 - r) % 64 for r in _RHO_OFFSETS], dtype=np.uint64)
+_RHO_DEST = np.array(_PI_LANES)
+_CHI_1 = np.array([(x + 1) % 5 + 5 * y for y in range(5) for x in range(5)])
+_CHI_2 = np.array([(x + 2) % 5 + 5 * y for y in range(5) for x in range(5)])
+_ROUND_CONSTANTS_U64 = [np.uint64(rc) for rc in _ROUND_CONSTANTS]
+_ONE = np.uint64(1)
+_SIXTY_THREE = np.uint64(63)
+
+
+def _f1600_lanes(a, rounds=24):
+    """SHA3 f function on a (25, N) uint64 array, lane x, y of each state in row x + 5 * y.
+    rounds less than 24 apply Keccak-p[1600, rounds], the last rounds of Keccak-f.
+    Returns the permuted array.
+    """
+    rho = _RHO[:, None]
+    rho_complement = _RHO_COMPLEMENT[:, None]
+    b = np.empty_like(a)
+    for rc in _ROUND_CONSTANTS_U64[24 - rounds :]:
+        # θ
+        c = a[0:5] ^ a[5:10] ^ a[10:15] ^ a[15:20] ^ a[20:25]
+        c1 = np.roll(c, -1, axis=0)
+        d = np.roll(c, 1, axis=0) ^ ((c1 << _ONE) | (c1 >> _SIXTY_THREE))
+        a ^= np.tile(d, (5, 1))
+        # p and π, lanes with a null rotation offset have a null complement as well
+        b[_RHO_DEST] = (a << rho) | np.where(rho_complement == 0, 0, a >> rho_complement)
+        # χ
+        a = b ^ (~b[_CHI_1] & b[_CHI_2])
+        # i
+        a[0] ^= rc
+    return a
+
+
+def f1600_many(states):
+    """SHA3 f function applied to each row of a (N, 25) uint64 array, in place.
+    Lane x, y of each state is in column x + 5 * y.
+    """
+    states[:] = _f1600_lanes(np.ascontiguousarray(states.T)).T
+
+
+def _pad(message, bitlen, suffix, rate_bytes):
+    """Return the padded message as a bytearray of whole blocks."""
+    with memoryview(message) as view, view.cast('B') as data:
+        if bitlen is None:
+            bitlen = len(data) * 8
+        elif bitlen > len(data) * 8:
+            raise ValueError('bitlen=%d but data has only %d bits' % (bitlen, len(data) * 8))
+        nbytes = (bitlen + 7) // 8
+        nblocks = (bitlen + len(suffix) + 1 + rate_bytes * 8 - 1) // (rate_bytes * 8)
+        out = bytearray(nblocks * rate_bytes)
+        out[0:nbytes] = data[0:nbytes]
+    if bitlen % 8:
+        out[nbytes - 1] &= (1 << (bitlen % 8)) - 1
+    for i, bit in enumerate(suffix):
+        if '1' == bit:
+            pos = bitlen + i
+            out[pos // 8] |= 1 << (pos % 8)
+    out[-1] |= 0x80
+    return out
+
+
+def keccak_many(messages, capacity, suffix, outlen, *, bitlens=None, rounds=24):
+    """Hash each message of messages with the sponge defined by capacity and suffix.
+
+    suffix can be a single string or one string per message.
+    bitlens is None or a sequence giving the bit length of each message (None entries
+    mean the full message).
+    rounds is the number of rounds of the permutation, 12 for TurboSHAKE.
+    Return the list of outputs, outlen bytes each, in input order.
+    """
+    if (capacity % 64) != 0:
+        raise ValueError('capacity is not a multiple of 64: %d' % capacity)
+    rate_bytes = (1600 - capacity) // 8
+    nlanes = rate_bytes // 8
+    n = len(messages)
+    if bitlens is None:
+        bitlens = [None] * n
+    if isinstance(suffix, str):
+        suffix = [suffix] * n
+    if not (n == len(bitlens) == len(suffix)):
+        raise ValueError('messages, bitlens and suffix must have the same length')
+    padded = [_pad(m, b, s, rate_bytes) for m, b, s in zip(messages, bitlens, suffix)]
+    # sort by decreasing number of blocks: messages still absorbing at block i are a prefix
+    order = sorted(range(n), key=lambda i: -len(padded[i]))
+    padded = [padded[i] for i in order]
+    a = np.zeros((25, n), dtype=np.uint64)
+    active = n
+    start = 0
+    while True:
+        while active and len(padded[active - 1]) <= start:
+            active -= 1
+        if 0 == active:
+            break
+        data = b''.join(p[start : start + rate_bytes] for p in padded[0:active])
+        lanes = np.frombuffer(data, dtype='<u8').reshape(active, nlanes).T
+        a[0:nlanes, 0:active] ^= lanes
+        a[:, 0:active] = _f1600_lanes(np.ascontiguousarray(a[:, 0:active]), rounds)
+        start += rate_bytes
+    out = []
+    remaining = outlen
+    while True:
+        out.append(a[0:nlanes].T.astype('<u8').tobytes())
+        remaining -= rate_bytes
+        if remaining <= 0:
+            break
+        a = _f1600_lanes(a, rounds)
+    squeezed = [np.frombuffer(o, dtype=np.uint8).reshape(n, rate_bytes) for o in out]
+    squeezed = np.concatenate(squeezed, axis=1)[:, 0:outlen]
+    digests = [b''] * n
+    for pos, i in enumerate(order):
+        digests[i] = squeezed[pos].tobytes()
+    return digests
+
+
+def sha3_224_many(messages, *, bitlens=None):
+    """SHA3-224 of each message, see keccak_many"""
+    return keccak_many(messages, 448, '011', 28, bitlens=bitlens)
+
+
+def sha3_256_many(messages, *, bitlens=None):
+    """SHA3-256 of each message, see keccak_many"""
+    return keccak_many(messages, 512, '011', 32, bitlens=bitlens)
+
+
+def sha3_384_many(messages, *, bitlens=None):
+    """SHA3-384 of each message, see keccak_many"""
+    return keccak_many(messages, 768, '011', 48, bitlens=bitlens)
+
+
+def sha3_512_many(messages, *, bitlens=None):
+    """SHA3-512 of each message, see keccak_many"""
+    return keccak_many(messages, 1024, '011', 64, bitlens=bitlens)
+
+
+def shake_128_many(messages, outlen, *, bitlens=None):
+    """SHAKE128 of each message, outlen bytes each, see keccak_many"""
+    return keccak_many(messages, 256, '11111', outlen, bitlens=bitlens)
+
+
+def shake_256_many(messages, outlen, *, bitlens=None):
+    """SHAKE256 of each message, outlen bytes each, see keccak_many"""
+    return keccak_many(messages, 512, '11111', outlen, bitlens=bitlens)
@@ -0,0 +1,195 @@
+"""Benchmarks of sha3bit, next to hashlib on the same inputs when it has an equivalent.
+
+Run ``python3 -m sha3bit.bench --help`` for usage.
+Results can be saved as JSON and compared with a previous run to detect regressions.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import timeit
+
+import sha3bit
+from sha3bit import Keccak, kangarootwelve_128, sha3_256, shake_128, turboshake_128
+
+ABSORB_SIZES = (1, 64, 1024, 1 << 14, 1 << 20, 1 << 26)
+
+
+def _ns_per_call(func, *, min_time, repeat):
+    """Return the best time of func in ns over repeat measurements, each one lasting at least min_time seconds"""
+    timer = timeit.Timer(func)
+    number = 1
+    while True:
+        elapsed = timer.timeit(number)
+        if elapsed >= min_time:
+            break
+        number = max(number * 2, int(number * min_time / max(elapsed, 1e-9)) + 1)
+    best = elapsed / number
+    for _ in range(repeat - 1):
+        best = min(best, timer.timeit(number) / number)
+    return best * 1e9
+
+
+def _run_python(code):
+    """Run code in a new interpreter, able to import this copy of sha3bit"""
+    env = dict(os.environ)
+    root = os.path.dirname(os.path.dirname(os.path.abspath(sha3bit.__file__)))
+    env['PYTHONPATH'] = os.pathsep.join(p for p in (root, env.get('PYTHONPATH')) if p)
+    subprocess.run([sys.executable, '-c', code], env=env, check=True, stdout=subprocess.DEVNULL)  # noqa: S603
+
+
+def _benchmarks(sizes):
+    """Yield (name, bytes per call, sha3bit function, hashlib function or None)"""
+    lanes = [0] * 25
+    yield 'f1600', 200, lambda: Keccak._f1600(lanes), None
+
+    for size in sizes:
+        msg = bytes(size)
+        yield (
+            'sha3_256_%d' % size,
+            size,
+            lambda msg=msg: sha3_256(msg).digest(),
+            lambda msg=msg: hashlib.sha3_256(msg).digest(),
+        )
+
+    msg = bytes(1 << 14)
+    yield (
+        'sha3_256_accelerated_16384',
+        len(msg),
+        lambda: sha3_256(msg, accelerated=True).digest(),
+        lambda: hashlib.sha3_256(msg).digest(),
+    )
+
+    # reduced round sponges, the tree of KangarooTwelve hashes its 8192 bytes chunks in batches
+    msg = bytes(1 << 20)
+    yield 'turboshake_128_1048576', len(msg), lambda: turboshake_128(msg).digest(32), None
+    yield 'kangarootwelve_128_1048576', len(msg), lambda: kangarootwelve_128(msg).digest(32), None
+
+    chunks = [bytes(16)] * 1000
+
+    def small_updates(h):
+        for chunk in chunks:
+            h.update(chunk)
+
+    yield 'update_16x1000', 16 * 1000, lambda: small_updates(sha3_256()), lambda: small_updates(hashlib.sha3_256())
+
+    msg = bytes(1024)
+
+    def unaligned_updates():
+        h = sha3_256()
+        for _ in range(16):
+            h.update(msg, bitlen=1024 * 8 - 3)
+
+    yield 'update_unaligned_1KBx16', 1024 * 16, unaligned_updates, None
+
+    h = shake_128(b'abc')
+    model = hashlib.shake_128(b'abc')
+    for size in (1 << 10, 1 << 20):
+        yield 'squeez_%d' % size, size, lambda size=size: h.squeez(size), lambda size=size: model.digest(size)
+
+    h = sha3_256(bytes(100))
+    yield 'export_import_state', 0, lambda: sha3_256.import_state(h.export_state()), None
+    yield 'export_import_state_bytes', 0, lambda: sha3_256.import_state_bytes(h.export_state_bytes()), None
+
+    h = shake_128(bytes(100))
+    model = hashlib.shake_128(bytes(100))
+    # digest() of a new object: repeated digests of one object are served by its cached output
+    yield 'shake_digest_32', 32, lambda: h.copy().digest(32), lambda: model.copy().digest(32)
+    yield 'copy', 0, h.copy, model.copy
+
+    # start up of a new interpreter hashing a single value, as done by short lived processes
+    yield 'import', 0, lambda: _run_python('import sha3bit'), lambda: _run_python('import hashlib')
+    yield (
+        'cli_sha3_256',
+        0,
+        lambda: _run_python("from sha3bit import cli; cli.main(['--sha3-256', '616263'])"),
+        lambda: _run_python("import hashlib; print(hashlib.sha3_256(b'abc').hexdigest())"),
+    )
+
+
+def run(*, sizes=ABSORB_SIZES, min_time=0.2, repeat=3, names=None, progress=None):
+    """Run the benchmarks, return a list of dict, one per benchmark.
+    names restricts the run to the benchmarks with these names.
+    progress is called with each result as soon as it is available.
+    """
+    results = []
+    for name, nbytes, func, model in _benchmarks(sizes):
+        if names is not None and name not in names:
+            continue
+        result = {'name': name, 'bytes': nbytes}
+        for prefix, f in (('', func), ('hashlib_', model)):
+            if f is None:
+                continue
+            ns = _ns_per_call(f, min_time=min_time, repeat=repeat)
+            result[prefix + 'ns_per_op'] = ns
+            result[prefix + 'mb_per_s'] = nbytes * 1e3 / ns if nbytes else None
+        results.append(result)
+        if progress is not None:
+            progress(result)
+    return results
+
+
+def compare(baseline, current, *, threshold=0.1):
+    """Return the list of (name, baseline ns/op, current ns/op) for benchmarks slower by more than threshold"""
+    reference = {r['name']: r['ns_per_op'] for r in baseline['results']}
+    regressions = []
+    for r in current['results']:
+        ref = reference.get(r['name'])
+        if ref is not None and r['ns_per_op'] > ref * (1 + threshold):
+            regressions.append((r['name'], ref, r['ns_per_op']))
+    return regressions
+
+
+def _print_result(r, out=None):
+    out = out or sys.stdout
+    mb_per_s = '' if r['mb_per_s'] is None else '%10.3f MB/s' % r['mb_per_s']
+    line = '%-28s %16.0f ns/op %15s' % (r['name'], r['ns_per_op'], mb_per_s)
+    if 'hashlib_ns_per_op' in r:
+        line += '   hashlib: %14.0f ns/op (x%.0f)' % (r['hashlib_ns_per_op'], r['ns_per_op'] / r['hashlib_ns_per_op'])
+    print(line, file=out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='sha3bit.bench')
+    parser.add_argument('--json', metavar='FILE', help='Write results to FILE')
+    parser.add_argument('--max-size', help='Largest message size for absorb benchmarks', default=1 << 26, type=int)
+    parser.add_argument('--min-time', help='Minimal duration of a measurement in seconds', default=0.2, type=float)
+    parser.add_argument('--repeat', help='Number of measurements, the best one is kept', default=3, type=int)
+    parser.add_argument('--only', nargs='+', metavar='NAME', help='Run only these benchmarks')
+    parser.add_argument(
+        '--compare', nargs=2, metavar=('BASELINE', 'CURRENT'), help='Compare two result files instead of running'
+    )
+    parser.add_argument('--threshold', help='Tolerated slow down for --compare', default=0.1, type=float)
+    args = parser.parse_args(argv)
+
+    if args.compare is not None:
+        with open(args.compare[0]) as f:
+            baseline = json.load(f)
+        with open(args.compare[1]) as f:
+            current = json.load(f)
+        regressions = compare(baseline, current, threshold=args.threshold)
+        for name, ref, ns in regressions:
+            print('%s: %.0f ns/op -> %.0f ns/op (+%.1f%%)' % (name, ref, ns, 100 * (ns / ref - 1)))
+        return 1 if regressions else 0
+
+    sizes = [s for s in ABSORB_SIZES if s <= args.max_size]
+    results = run(sizes=sizes, min_time=args.min_time, repeat=args.repeat, names=args.only, progress=_print_result)
+    if args.json is not None:
+        report = {
+            'sha3bit': getattr(sha3bit, '__version__', None),
+            'python': sys.version,
+            'implementation': platform.python_implementation(),
+            'machine': platform.machine(),
+            'results': results,
+        }
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
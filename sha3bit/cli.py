@@ -1,11 +1,166 @@
 import argparse
 import logging
-
-from pysatl import Utils
+import os
+import sys
 
 import sha3bit
 
-if __name__ == '__main__':
+
+def _parse_hex(text):
+    """Return the bytes written in hex in text.
+    Like pysatl Utils.ba: any non alphanumeric character is a separator, numbers can start with '0x'
+    and a number with an odd count of digits gets a leading 0.
+    """
+    out = bytearray()
+    for word in ''.join(c if c.isalnum() else ' ' for c in text.lower()).split():
+        if '0x' == word[0:2]:
+            word = word[2:]
+        if len(word) % 2:
+            word = '0' + word
+        out += bytes.fromhex(word)
+    return out
+
+
+def _hexstr(data):
+    """Format data as upper case hex bytes separated by spaces, like pysatl Utils.hexstr"""
+    return ' '.join('%02X' % b for b in data)
+
+
+def _read_chunks(f, block_size):
+    """Yield memoryviews over the content of the binary file f, reusing a single buffer."""
+    buf = bytearray(block_size * 512)
+    view = memoryview(buf)
+    while True:
+        n = f.readinto(buf)
+        if not n:
+            break
+        yield view[0:n]
+
+
+def _hash_stream(f, cls, output_size):
+    """Return the hex digest of the content of the binary file f, output_size is None for SHA3"""
+    impl = cls()
+    for chunk in _read_chunks(f, impl.block_size):
+        impl.update(chunk)
+    if output_size is None:
+        return impl.hexdigest()
+    return impl.hexdigest(output_size)
+
+
+def _hash_file(path, cls, output_size):
+    """Return (path, hexdigest, error message)"""
+    try:
+        if not os.path.isfile(path):  # pipes and devices cannot be mapped in memory
+            with open(path, 'rb') as f:
+                return path, _hash_stream(f, cls, output_size), None
+        if output_size is None:
+            digest = sha3bit.hash_file(path, cls)
+        else:
+            digest = sha3bit.shake_file(path, cls, output_size)
+        return path, digest.hex(), None
+    except OSError as e:
+        return path, None, e.strerror
+
+
+def _expand_paths(paths, *, recursive):
+    """Yield the files to hash, directories are replaced by the files they contain."""
+    for path in paths:
+        if '-' == path or not os.path.isdir(path):
+            yield path
+        elif recursive:
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    yield os.path.join(root, name)
+        else:
+            for name in sorted(os.listdir(path)):
+                p = os.path.join(path, name)
+                if not os.path.isdir(p):
+                    yield p
+
+
+def _merge_stdin(paths, results, cls, output_size):
+    for path in paths:
+        if '-' == path:
+            yield path, _hash_stream(sys.stdin.buffer, cls, output_size), None
+        else:
+            yield next(results)
+
+
+def _hash_files(paths, cls, output_size, *, jobs):
+    """Yield (path, hexdigest, error message) for each path, in order.
+    Files are hashed by a pool of jobs processes, standard input is hashed by the current process.
+    """
+    files = [p for p in paths if '-' != p]
+    if jobs > 1 and len(files) > 1:
+        import concurrent.futures
+
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+            n = len(files)
+            results = executor.map(_hash_file, files, [cls] * n, [output_size] * n, chunksize=4)
+            yield from _merge_stdin(paths, results, cls, output_size)
+    else:
+        results = (_hash_file(p, cls, output_size) for p in files)
+        yield from _merge_stdin(paths, results, cls, output_size)
+
+
+def _parse_manifest(path):
+    """Return the list of (expected digest, path) listed in a checksum file as written by this tool."""
+    entries = []
+    f = sys.stdin if '-' == path else open(path)
+    with f:
+        for line in f:
+            line = line.rstrip('\n')
+            if not line:
+                continue
+            digest, _, name = line.partition(' ')
+            if name[0:1] in (' ', '*'):
+                name = name[1:]
+            entries.append((digest.lower(), name))
+    return entries
+
+
+def sum_files(paths, cls, output_size=None, *, recursive=False, jobs=1, out=None):
+    """Print the digest of each file like sha3sum, return the number of files which could not be read.
+    output_size is the digest size in bytes for SHAKE, None for SHA3.
+    """
+    out = out or sys.stdout
+    errors = 0
+    for path, digest, error in _hash_files(
+        list(_expand_paths(paths, recursive=recursive)), cls, output_size, jobs=jobs
+    ):
+        if error is None:
+            print('%s  %s' % (digest, path), file=out)
+        else:
+            print('sha3bit: %s: %s' % (path, error), file=sys.stderr)
+            errors += 1
+    return errors
+
+
+def check_files(manifest, cls, output_size=None, *, jobs=1, out=None):
+    """Verify the digests listed in manifest, return the number of files which failed.
+    output_size is the digest size in bytes for SHAKE, None for SHA3.
+    """
+    out = out or sys.stdout
+    entries = _parse_manifest(manifest)
+    failed = 0
+    paths = [name for _, name in entries]
+    for (expected, _), (path, digest, error) in zip(entries, _hash_files(paths, cls, output_size, jobs=jobs)):
+        if error is not None:
+            print('sha3bit: %s: %s' % (path, error), file=sys.stderr)
+            print('%s: FAILED open or read' % path, file=out)
+            failed += 1
+        elif digest == expected:
+            print('%s: OK' % path, file=out)
+        else:
+            print('%s: FAILED' % path, file=out)
+            failed += 1
+    if failed:
+        print('sha3bit: WARNING: %d of %d computed checksums did NOT match' % (failed, len(entries)), file=sys.stderr)
+    return failed
+
+
+def main(argv=None):
     parser = argparse.ArgumentParser(description='sha3bit.cli')
     levels = ('DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL')
     parser.add_argument('--log-level', default='WARNING', choices=levels)
@@ -18,13 +173,20 @@ if __name__ == '__main__':
     alg_group.add_argument('--shake-128', help='Use SHAKE-128 algorythm', action='store_true')
     alg_group.add_argument('--shake-256', help='Use SHAKE-256 algorythm', action='store_true')
     parser.add_argument('--digest-size', help='Output size in bytes', default=None, type=int)
-    parser.add_argument('message', nargs=1, help='Message to hash', type=str)
-    args = parser.parse_args()
+    input_group = parser.add_mutually_exclusive_group(required=True)
+    input_group.add_argument('message', nargs='?', help='Message to hash', type=str)
+    input_group.add_argument(
+        '--files', nargs='+', metavar='PATH', help="Files or directories to hash, '-' for standard input"
+    )
+    input_group.add_argument('-c', '--check', metavar='FILE', help='Read checksums from FILE and check them')
+    parser.add_argument('-r', '--recursive', help='Hash directories recursively', action='store_true')
+    parser.add_argument(
+        '-j', '--jobs', help='Number of worker processes (default: number of CPUs)', default=None, type=int
+    )
+    args = parser.parse_args(argv)
 
     logging.basicConfig(format='%(message)s', level=args.log_level)
 
-    msg = Utils.ba(args.message[0])
-
     cls = None
     xof = False
     if args.sha3_224:
@@ -42,22 +204,39 @@ if __name__ == '__main__':
     if args.shake_256:
         cls = sha3bit.shake(256)
 
-    verbose = args.log_level in ['DEBUG', 'INFO']
-    impl = cls(msg, bitlen=args.bit_length, verbose=verbose)
-
     if args.digest_size is None:
-        output_size = impl.digest_size
+        output_size = cls.seclevel // 8
     else:
         output_size = args.digest_size
+    if not xof and output_size != cls.seclevel // 8:
+        raise ValueError(
+            'digest-length is %d but SHA3-%d support only %d' % (output_size, cls.seclevel, cls.seclevel // 8)
+        )
+
+    if args.message is None:
+        if args.bit_length is not None:
+            parser.error('--bit-length is supported only with a message')
+        jobs = args.jobs or os.cpu_count() or 1
+        if not xof:
+            output_size = None
+        if args.check is not None:
+            return 1 if check_files(args.check, cls, output_size, jobs=jobs) else 0
+        return 1 if sum_files(args.files, cls, output_size, recursive=args.recursive, jobs=jobs) else 0
+
+    msg = _parse_hex(args.message)
+
+    verbose = args.log_level in ['DEBUG', 'INFO']
+    impl = cls(msg, bitlen=args.bit_length, verbose=verbose)
 
     if xof:
         digest = impl.digest(output_size)
     else:
-        if output_size != impl.digest_size:
-            raise ValueError(
-                'digest-length is %d but SHA3-%d support only %d' % (output_size, impl.seclevel, impl.digest_size)
-            )
         digest = impl.digest()
 
     if not verbose:
-        print(Utils.hexstr(digest))
+        print(_hexstr(digest))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
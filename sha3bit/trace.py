@@ -0,0 +1,115 @@
+"""Binary recording of the Keccak state, rendered as text only on demand.
+
+A TraceRecorder is an Instrumentation: pass it as the instrumentation argument of a hash object and it
+records each input block and the state after each step of each round as fixed size binary records.
+Records go to a growing bytearray, a preallocated buffer (bytearray, uint8 NumPy array...) or a binary
+file. Nothing is formatted while hashing, render() turns records into text lazily, one record at a time.
+
+A record is 208 bytes: kind (0: block, 1: theta, 2: rho_pi, 3: chi, 4: iota), round, number of lanes,
+5 bytes of padding and 25 lanes as little endian 64 bit integers. Block records hold the rate lanes of
+the input block followed by zeros, step records hold the 25 lanes of the state (lane x, y at index x + 5 * y).
+"""
+
+import struct
+
+from sha3bit import Instrumentation, Keccak
+
+RECORD = struct.Struct('<BBB5x25Q')
+KINDS = ('block', 'theta', 'rho_pi', 'chi', 'iota')
+_KIND_CODES = {kind: code for code, kind in enumerate(KINDS)}
+_ZERO_LANES = [(0,) * n for n in range(26)]
+
+
+def record_dtype():
+    """Return the NumPy structured dtype of a record"""
+    import numpy as np
+
+    return np.dtype([('kind', 'u1'), ('round', 'u1'), ('nlanes', 'u1'), ('pad', 'u1', 5), ('lanes', '<u8', 25)])
+
+
+class TraceRecorder(Instrumentation):
+    def __init__(self, out=None, *, steps=True, timing=False):
+        """Record blocks and steps as binary records, see the module documentation for the format.
+        out is None to record in memory, a binary file (any object with a write method) to stream records,
+        or a writable buffer to fill, ValueError is raised once it is full.
+        steps=False records only the input blocks, permutations then use the fast code path.
+        Counters of Instrumentation are available as well.
+        """
+        super().__init__(timing=timing, on_block=self._record_block, on_step=self._record_step if steps else None)
+        self.nrecords = 0
+        self._file = None
+        self._buffer = None
+        self._view = None
+        if out is None:
+            self._buffer = bytearray()
+        elif hasattr(out, 'write'):
+            self._file = out
+        else:
+            self._view = memoryview(out).cast('B')
+        self._pos = 0
+
+    def __len__(self):
+        return self.nrecords
+
+    def _record(self, kind, rnd, nlanes, lanes):
+        if self._file is not None:
+            self._file.write(RECORD.pack(kind, rnd, nlanes, *lanes))
+        elif self._view is None:
+            self._buffer += RECORD.pack(kind, rnd, nlanes, *lanes)
+        else:
+            if self._pos + RECORD.size > len(self._view):
+                raise ValueError('trace buffer is full (%d records)' % self.nrecords)
+            RECORD.pack_into(self._view, self._pos, kind, rnd, nlanes, *lanes)
+        self._pos += RECORD.size
+        self.nrecords += 1
+
+    def _record_block(self, block_lanes):
+        n = len(block_lanes)
+        self._record(0, 0, n, block_lanes + _ZERO_LANES[25 - n])
+
+    def _record_step(self, rnd, step, lanes):
+        self._record(_KIND_CODES[step], rnd, 25, lanes)
+
+    def getbuffer(self):
+        """Return a memoryview over the records kept in memory (not available when streaming to a file).
+        When recording in memory, the view must be released before recording more.
+        """
+        if self._file is not None:
+            raise ValueError('records are streamed to a file')
+        if self._view is None:
+            return memoryview(self._buffer)
+        return self._view[0 : self._pos]
+
+    def to_numpy(self):
+        """Return the records kept in memory as a NumPy array of record_dtype(), without copy"""
+        import numpy as np
+
+        return np.frombuffer(self.getbuffer(), dtype=record_dtype())
+
+
+def iter_records(data):
+    """Yield (kind, round, lanes) for each record of data.
+    data is a TraceRecorder, a bytes-like object or a binary file, which is read one record at a time.
+    lanes is a tuple of the rate lanes for blocks and of the 25 lanes for steps.
+    """
+    if isinstance(data, TraceRecorder):
+        data = data.getbuffer()
+    if hasattr(data, 'read'):
+        while True:
+            record = data.read(RECORD.size)
+            if len(record) < RECORD.size:
+                return
+            kind, rnd, nlanes, *lanes = RECORD.unpack(record)
+            yield KINDS[kind], rnd, tuple(lanes[0:nlanes])
+    else:
+        for kind, rnd, nlanes, *lanes in RECORD.iter_unpack(data):
+            yield KINDS[kind], rnd, tuple(lanes[0:nlanes])
+
+
+def render(data):
+    """Yield the text of each record of data (as in iter_records), in the layout of the verbose traces"""
+    for kind, rnd, lanes in iter_records(data):
+        if 'block' == kind:
+            yield 'process block:\n' + Keccak._state_str(lanes + _ZERO_LANES[25 - len(lanes)], limit=len(lanes))
+        else:
+            yield 'state after round %d %s:\n%s' % (rnd, kind, Keccak._state_str(lanes))
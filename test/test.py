@@ -1,6 +1,10 @@
+import array
 import hashlib
+import json
 import logging
+import mmap
 import re
+import tempfile
 from pathlib import Path
 
 from bitarray import bitarray
@@ -153,6 +157,191 @@ def check_hardcoded_test_vectors():
         check(test['msg'], test['bitlen'], test['digest'])
 
 
+def check_sp800_185_samples():
+    print('check cSHAKE and ParallelHash against NIST SP 800-185 samples')
+    # (https://csrc.nist.gov/projects/cryptographic-standards-and-guidelines/example-values)
+    tests = [
+        (sha3bit.cshake_128, bytes(range(4)), b'', 'c1c36925b6409a04f1b504fcbca9d82b4017277cb5ed2b2065fc1d3814d5aaf5'),
+        (
+            sha3bit.cshake_128,
+            bytes(range(200)),
+            b'',
+            'c5221d50e4f822d96a2e8881a961420f294b7b24fe3d2094baed2c6524cc166b',
+        ),
+        (
+            sha3bit.cshake_256,
+            bytes(range(4)),
+            b'',
+            'd008828e2b80ac9d2218ffee1d070c48b8e4c87bff32c9699d5b6896eee0edd1'
+            '64020e2be0560858d9c00c037e34a96937c561a74c412bb4c746469527281c8c',
+        ),
+    ]
+    for cls, msg, name, expected in tests:
+        h = cls(msg, function_name=name, customization=b'Email Signature')
+        assert expected == h.hexdigest(len(expected) // 2)
+    assert sha3bit.cshake_128(b'abc').digest(100) == hashlib.shake_128(b'abc').digest(100)
+
+    msg = bytes([16 * (i // 8) + i % 8 for i in range(24)])
+    tests = [
+        (sha3bit.parallelhash_128, b'', 'ba8dc1d1d979331d3f813603c67f72609ab5e44b94a0b8f9af46514454a2b4f5'),
+        (
+            sha3bit.parallelhash_128,
+            b'Parallel Data',
+            'fc484dcb3f84dceedc353438151bee58157d6efed0445a81f165e495795b7206',
+        ),
+        (
+            sha3bit.parallelhash_256,
+            b'',
+            'bc1ef124da34495e948ead207dd9842235da432d2bbc54b4c110e64c45110553'
+            '1b7f2a3e0ce055c02805e7c2de1fb746af97a1dd01f43b824e31b87612410429',
+        ),
+        (
+            sha3bit.parallelhash_256,
+            b'Parallel Data',
+            'cdf15289b54f6212b4bc270528b49526006dd9b54e2b6add1ef6900dda3963bb'
+            '33a72491f236969ca8afaea29c682d47a393c065b38e29fae651a2091c833110',
+        ),
+        (sha3bit.parallelhash_xof_128, b'', 'fe47d661e49ffe5b7d999922c062356750caf552985b8e8ce6667f2727c3c8d3'),
+        (
+            sha3bit.parallelhash_xof_128,
+            b'Parallel Data',
+            'ea2a793140820f7a128b8eb70a9439f93257c6e6e79b4a540d291d6dae7098d7',
+        ),
+        (
+            sha3bit.parallelhash_xof_256,
+            b'',
+            'c10a052722614684144d28474850b410757e3cba87651ba167a5cbddff7f4666'
+            '75fbf84bcae7378ac444be681d729499afca667fb879348bfdda427863c82f1c',
+        ),
+        (
+            sha3bit.parallelhash_xof_256,
+            b'Parallel Data',
+            '538e105f1a22f44ed2f5cc1674fbd40be803d9c99bf5f8d90a2c8193f3fe6ea7'
+            '68e5c1a20987e2c9c65febed03887a51d35624ed12377594b5585541dc377efc',
+        ),
+    ]
+    for cls, customization, expected in tests:
+        h = cls(msg, leaf_size=8, customization=customization)
+        assert expected == h.hexdigest(len(expected) // 2)
+        h = cls(leaf_size=8, customization=customization)
+        for i in range(len(msg)):
+            h.update(msg[i : i + 1])
+        assert expected == h.hexdigest(len(expected) // 2)
+
+
+def check_kmac_samples():
+    print('check KMAC against NIST SP 800-185 samples')
+    # (https://csrc.nist.gov/projects/cryptographic-standards-and-guidelines/example-values)
+    key = bytes(range(0x40, 0x60))
+    tagged = b'My Tagged Application'
+    tests = [
+        (sha3bit.kmac_128, bytes(range(4)), b'', 'e5780b0d3ea6f7d3a429c5706aa43a00fadbd7d49628839e3187243f456ee14e'),
+        (sha3bit.kmac_128, bytes(range(4)), tagged, '3b1fba963cd8b0b59e8c1a6d71888b7143651af8ba0a7070c0979e2811324aa5'),
+        (
+            sha3bit.kmac_256,
+            bytes(range(200)),
+            tagged,
+            'b58618f71f92e1d56c1b8c55ddd7cd188b97b4ca4d99831eb2699a837da2e4d9'
+            '70fbacfde50033aea585f1a2708510c32d07880801bd182898fe476876fc8965',
+        ),
+        (
+            sha3bit.kmac_xof_128,
+            bytes(range(4)),
+            tagged,
+            '31a44527b4ed9f5c6101d11de6d26f0620aa5c341def41299657fe9df1a3b16c',
+        ),
+        (
+            sha3bit.kmac_xof_256,
+            bytes(range(200)),
+            tagged,
+            'd5be731c954ed7732846bb59dbe3a8e30f83e77a4bff4459f2f1c2b4ecebb8ce'
+            '67ba01c62e8ab8578d2d499bd1bb276768781190020a306a97de281dcc30305d',
+        ),
+    ]
+    for cls, msg, customization, expected in tests:
+        length = len(expected) // 2
+        assert expected == cls(key, msg, customization=customization).hexdigest(length)
+        assert expected == cls(key, customization=customization).mac(msg, length).hex()
+
+
+def check_mac():
+    print('check HMAC-SHA3 and KMAC keyed state reuse')
+    import hmac
+
+    msgs = [b'', b'a', bytes(range(256)) * 3]
+    for key in (b'', b'key', bytes(range(200))):
+        for cls, model in (
+            (sha3bit.hmac_sha3_224, hashlib.sha3_224),
+            (sha3bit.hmac_sha3_256, hashlib.sha3_256),
+            (sha3bit.hmac_sha3_384, hashlib.sha3_384),
+            (sha3bit.hmac_sha3_512, hashlib.sha3_512),
+        ):
+            mac = cls(key)
+            ref = hmac.new(key, digestmod=model)
+            assert (ref.digest_size, ref.block_size, ref.name) == (mac.digest_size, mac.block_size, mac.name)
+            for msg in msgs:
+                expected = hmac.new(key, msg, model).digest()
+                assert expected == mac.mac(msg)
+                clone = mac.copy()
+                clone.update(msg[0:10])
+                clone.update(msg[10:])
+                assert expected == clone.digest()
+                assert expected.hex() == clone.hexdigest()
+            assert hmac.new(key, b''.join(msgs), model).digest() == cls(key, b''.join(msgs)).digest()
+    # bit granular messages
+    mac = sha3bit.hmac_sha3_256(b'key')
+    assert mac.mac(b'\x05', bitlen=3) != mac.mac(b'\x05', bitlen=4)
+    assert mac.mac(b'\xff\x05', bitlen=11) == sha3bit.hmac_sha3_256(b'key', b'\xff\x0d', bitlen=11).digest()
+
+    kmac = sha3bit.kmac_256(b'key', customization=b'app')
+    h = kmac.copy()
+    for msg in msgs:
+        h.update(msg)
+        assert kmac.mac(msg, 64) == sha3bit.kmac_256(b'key', msg, customization=b'app').digest(64)
+    assert h.digest(64) == kmac.mac(b''.join(msgs), 64)
+    # the output length is part of the KMAC input, not of the KMACXOF input
+    assert kmac.mac(b'abc', 32) != kmac.mac(b'abc', 64)[0:32]
+    kmac = sha3bit.kmac_xof_128(b'key')
+    assert kmac.mac(b'abc', 32) == kmac.mac(b'abc', 64)[0:32]
+
+
+def check_parallelhash():
+    print('check ParallelHash streaming and parallel leaves')
+    import concurrent.futures
+
+    msg = bytes(range(256)) * 16
+    for cls in (sha3bit.parallelhash_128, sha3bit.parallelhash_xof_256):
+        for leaf_size in (7, 1000, 1 << 15):
+            expected = cls(msg, leaf_size=leaf_size).digest(40)
+            h = cls(leaf_size=leaf_size)
+            for pos in range(0, len(msg), 777):
+                h.update(msg[pos : pos + 777])
+                if 0 == pos:
+                    h2 = h.copy()
+            assert expected == h.digest(40)
+            assert expected == h.digest(40)
+            h2.update(msg[777:])
+            assert expected == h2.digest(40)
+        assert not hasattr(h, '__dict__')
+        # the output length is encoded in the input of ParallelHash, not in the input of the XOF variant
+        assert (cls(msg).digest(40)[0:20] == cls(msg).digest(20)) == cls._xof
+    group_bytes = sha3bit._LEAF_GROUP_BYTES
+    sha3bit._LEAF_GROUP_BYTES = 1000  # many small groups to exercise the dispatch
+    try:
+        expected = sha3bit.parallelhash_256(msg, leaf_size=100).digest(64)
+        for executor_class in (concurrent.futures.ThreadPoolExecutor, concurrent.futures.ProcessPoolExecutor):
+            with executor_class(max_workers=2) as executor:
+                h = sha3bit.parallelhash_256(leaf_size=100, executor=executor)
+                for pos in range(0, len(msg), 1234):
+                    h.update(msg[pos : pos + 1234])
+                h2 = h.copy()
+                assert expected == h.digest(64)
+                h2.update(b'x')
+                assert expected != h2.digest(64)
+    finally:
+        sha3bit._LEAF_GROUP_BYTES = group_bytes
+
+
 def check_against_nist_cavp():
     print("check against 'short' and 'long' bit oriented test vectors from NIST CAVP")
     # (https://csrc.nist.gov/CSRC/media/Projects/Cryptographic-Algorithm-Validation-Program/documents/sha3/sha-3bittestvectors.zip)
@@ -195,6 +384,25 @@ def check_xof_against_nist_cavp():
                         check_xof(msg, bitlen, md, seclevel=seclevel)
 
 
+def check_f1600():
+    print('check f1600: unrolled implementation against step by step one')
+    # Keccak-f[1600] applied on the all zero state, from the Keccak team known answers
+    lanes = [0] * 25
+    sha3bit.Keccak._f1600(lanes)
+    assert lanes[0] == 0xF1258F7940E1DDE7
+    assert lanes[24] == 0xEAF1FF7B5CECA249
+    for seed in range(8):
+        lanes = list(hashlib.shake_128(bytes([seed])).digest(200))
+        lanes = [int.from_bytes(bytes(lanes[i * 8 : i * 8 + 8]), byteorder='little') for i in range(25)]
+        expected = list(lanes)
+        sha3bit.Keccak._f1600_verbose(expected)
+        sha3bit.Keccak._f1600(lanes)
+        assert expected == lanes
+        nested = sha3bit.Keccak.f1600(sha3bit.Keccak._unflatten(expected))
+        sha3bit.Keccak._f1600(lanes)
+        assert nested == sha3bit.Keccak._unflatten(lanes)
+
+
 def check_api():
     print('check API')
     msg = msg_generator(bytes(0), 300 * 8)
@@ -226,6 +434,326 @@ def check_api():
     state = dut.export_state()
     dut2 = sha3_256.import_state(state)
     assert dut2.hexdigest() == '1b2e61923578e35f3b4629e04a0ff3b73daa571ae01130d9c16ef7da7a4cfdc2'
+    # bitlen cannot go beyond the data, the state is left untouched
+    for accelerated in (False, True):
+        dut = sha3_256(msg[0:10], accelerated=accelerated)
+        for data, bitlen in ((b'abc', 64), (b'abc', 25), (b'', 1)):
+            try:
+                dut.update(data, bitlen=bitlen)
+                raise AssertionError('bitlen=%d accepted for %d bytes' % (bitlen, len(data)))
+            except ValueError:
+                pass
+        dut.update(msg[10:])
+        assert expected == dut.digest()
+
+
+def check_instrumentation():
+    print('check instrumentation')
+    assert type(sha3_256()._h) is sha3bit.Keccak  # default objects use the untraced code path
+    instrumentation = sha3bit.Instrumentation(timing=True)
+    h = sha3_256(bytes(200), instrumentation=instrumentation)
+    h2 = h.copy()
+    assert h.digest() == hashlib.sha3_256(bytes(200)).digest()
+    counters = instrumentation.counters()
+    assert counters['f1600_ns'] > 0
+    del counters['f1600_ns']
+    assert {'permutations': 2, 'blocks_absorbed': 2, 'bytes_squeezed': 32, 'unaligned_absorbs': 0} == counters
+    h2.update(b'\x01', bitlen=3)
+    h2.update(b'\x01', bitlen=5)
+    h2.digest()
+    assert 1 == instrumentation.unaligned_absorbs  # only the second update follows pending bits
+    assert 3 == instrumentation.permutations  # the first block was absorbed before the copy
+    instrumentation.reset()
+    assert 0 == sum(instrumentation.counters().values())
+
+    blocks = []
+    permutations = []
+    steps = []
+    instrumentation = sha3bit.Instrumentation(
+        on_block=blocks.append,
+        on_permute_in=lambda lanes: permutations.append(lanes[:]),
+        on_permute_out=lambda lanes: permutations.append(lanes[:]),
+        on_step=lambda r, step, lanes: steps.append((r, step, lanes[:])),
+    )
+    h = shake_128(b'abc', instrumentation=instrumentation)
+    assert h.squeez(300) == hashlib.shake_128(b'abc').digest(300)
+    assert 300 == instrumentation.bytes_squeezed
+    assert 1 == len(blocks)
+    assert 21 == len(blocks[0])
+    assert 0x1F636261 == blocks[0][0]
+    assert 4 == len(permutations)
+    for state_in, state_out in zip(permutations[0::2], permutations[1::2]):
+        sha3bit.Keccak._f1600(state_in)
+        assert state_in == state_out
+    assert 2 * 24 * 4 == len(steps)
+    assert ['theta', 'rho_pi', 'chi', 'iota'] == [step for _, step, _ in steps[0:4]]
+    assert (23, 'iota', permutations[1]) == steps[24 * 4 - 1]
+
+
+def check_api_copy():
+    print('check API: copy')
+    msg = msg_generator(bytes(0), 300 * 8)
+    for len1 in range(0, len(msg) * 8, 7):
+        dut = sha3_256(msg, bitlen=len1)
+        clone = dut.copy()
+        dut.update(b'\x01', bitlen=1)
+        assert sha3_256(msg, bitlen=len1).digest() == clone.digest()
+        assert clone.digest() != dut.digest()
+    assert clone.copy().digest() == clone.digest()
+    dut = shake_128(msg)
+    clone = dut.copy()
+    dut.update(msg)
+    assert hashlib.shake_128(msg).digest(500) == clone.digest(500)
+    assert hashlib.shake_128(msg + msg).digest(500) == dut.digest(500)
+    r0 = clone.squeez(100)
+    r1 = clone.copy().squeez(400)
+    assert hashlib.shake_128(msg).digest(500) == r0 + r1
+    assert r1 == clone.squeez(400)
+
+
+def check_prefix_cache():
+    print('check API: prefix cache')
+    prefix = msg_generator(bytes(0), 400 * 8)
+    cache = sha3bit.PrefixCache('sha3_256', max_entries=3)
+    for bitlen in [0, 5, 8, 1087, 1088, 1089, 3000]:
+        for i in range(3):
+            dut = cache.get(prefix, bitlen=bitlen)
+            dut.update(bytes([i]))
+            expected = sha3_256(prefix, bitlen=bitlen)
+            expected.update(bytes([i]))
+            assert expected.digest() == dut.digest()
+    assert 3 == len(cache)
+    assert 14 == cache.hits
+    assert 7 == cache.misses
+    cache = sha3bit.PrefixCache(shake_128, max_bytes=1000)
+    for i in range(10):
+        cache.get(prefix[i:])
+    assert cache.nbytes <= 1000
+    dut = shake_128.from_prefix(prefix)
+    dut.update(prefix)
+    assert hashlib.shake_128(prefix + prefix).digest(100) == dut.digest(100)
+    dut = shake_128.from_prefix(prefix)
+    assert hashlib.shake_128(prefix).digest(100) == dut.digest(100)
+
+
+def check_api_state_bytes():
+    print('check API: export_state_bytes / import_state_bytes')
+    msg = msg_generator(bytes(0), 300 * 8)
+    expected = hashlib.sha3_256(msg).digest()
+    for len1 in range(0, len(msg) * 8, 3):
+        dut1 = sha3_256(msg, bitlen=len1)
+        state = dut1.export_state_bytes()
+        assert 15 + 200 + (len1 % 1088 + 7) // 8 == len(state)
+        dut2 = sha3_256.import_state_bytes(bytearray(state))
+        dut1.update(b'\x03', bitlen=2)
+        dut2.update(b'\x03', bitlen=2)
+        assert dut1.digest() == dut2.digest()
+    dut = sha3_256(msg)
+    dut.digest()
+    assert expected == sha3_256.import_state_bytes(dut.export_state_bytes()).digest()
+    dut = shake_128(msg)
+    r0 = dut.squeez(100)
+    dut2 = shake_128.import_state_bytes(memoryview(dut.export_state_bytes()))
+    assert hashlib.shake_128(msg).digest(500) == r0 + dut2.squeez(400)
+    try:
+        shake_128.import_state_bytes(bytes(215))
+        raise AssertionError('invalid state not detected')
+    except ValueError:
+        pass
+
+
+def check_api_buffers():
+    print('check API: buffer protocol inputs')
+    msg = msg_generator(bytes(0), 1000 * 8)
+    expected = hashlib.sha3_256(msg).digest()
+    assert expected == sha3_256(memoryview(msg)).digest()
+    assert expected == sha3_256(array.array('Q', bytes(msg))).digest()
+    dut = sha3_256()
+    view = memoryview(msg)
+    for p in range(0, len(msg), 100):
+        dut.update(view[p : p + 100])
+    assert expected == dut.digest()
+    with tempfile.TemporaryFile() as f:
+        f.write(msg)
+        f.flush()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            dut = shake_128(mm)
+            mm.close()  # fails if a view of the mmap is still alive
+    assert hashlib.shake_128(msg).digest(100) == dut.digest(100)
+    dut = shake_128(memoryview(msg)[0:4], bitlen=31)
+    assert shake_128(msg[0:4], bitlen=31).digest(32) == dut.digest(32)
+
+
+def check_batch():
+    print('check batch API against scalar implementation')
+    from sha3bit import batch
+
+    msgs = [msg_generator(bytes(0), bitlen) for bitlen in (0, 8, 1080, 1088, 1096, 3000 * 8)]
+    msgs += [msg[0:3] for msg in msgs[1:]]
+    bitlens = [None] * (len(msgs) // 2) + [len(msg) * 8 - 3 if msg else 0 for msg in msgs[len(msgs) // 2 :]]
+    for seclevel in [224, 256, 384, 512]:
+        digests = getattr(batch, 'sha3_%d_many' % seclevel)(msgs, bitlens=bitlens)
+        for msg, bitlen, digest in zip(msgs, bitlens, digests):
+            assert digest == sha3bit.sha3(seclevel)(msg, bitlen=bitlen).digest()
+    for seclevel in [128, 256]:
+        digests = getattr(batch, 'shake_%d_many' % seclevel)(msgs, 500, bitlens=bitlens)
+        for msg, bitlen, digest in zip(msgs, bitlens, digests):
+            assert digest == sha3bit.shake(seclevel)(msg, bitlen=bitlen).digest(500)
+    # same error as the scalar classes when bitlen goes beyond the data
+    for data, bitlen in ((b'abc', 64), (b'', 1)):
+        try:
+            batch.sha3_256_many([b'', data], bitlens=[None, bitlen])
+            raise AssertionError('bitlen=%d accepted for %d bytes' % (bitlen, len(data)))
+        except ValueError as e:
+            assert 'bitlen=%d but data has only %d bits' % (bitlen, len(data) * 8) == str(e)
+
+
+def check_aio():
+    print('check aio')
+    import asyncio
+    import concurrent.futures
+
+    from sha3bit import aio
+
+    msg = bytes(range(256)) * 20
+
+    async def chunks(size):
+        for pos in range(0, len(msg), size):
+            yield msg[pos : pos + size]
+
+    def reader():
+        stream = asyncio.StreamReader()
+        stream.feed_data(msg)
+        stream.feed_eof()
+        return stream
+
+    async def ticker(ticks):
+        while True:
+            await asyncio.sleep(0)
+            ticks.append(None)
+
+    async def run(executor):
+        ticks = []
+        task = asyncio.ensure_future(ticker(ticks))
+        digest = await aio.hash_stream(reader(), 'sha3_256', executor=executor, batch_size=1000)
+        assert digest == hashlib.sha3_256(msg).digest()
+        assert ticks  # the loop kept running while hashing
+        task.cancel()
+        for size in (1, 100, 5000):
+            for batch_size in (1, 136 * 3, 1 << 16):
+                digest = await aio.hash_stream(chunks(size), sha3bit.sha3_512, executor=executor, batch_size=batch_size)
+                assert digest == hashlib.sha3_512(msg).digest()
+        output = await aio.shake_stream(chunks(300), 'shake128', 500, executor=executor, batch_size=200)
+        assert output == hashlib.shake_128(msg).digest(500)
+        h = await aio.absorb_stream(shake_128(b'prefix'), reader(), executor=executor, batch_size=500)
+        output = b''.join([chunk async for chunk in aio.squeeze_stream(h, 200, length=1000, executor=executor)])
+        assert output == hashlib.shake_128(b'prefix' + msg).digest(1000)
+        stream = aio.squeeze_stream(shake_128(), 7, executor=executor)
+        output = [await stream.__anext__() for _ in range(50)]
+        assert b''.join(output) == hashlib.shake_128().digest(350)
+
+    asyncio.run(run(None))
+    with concurrent.futures.ProcessPoolExecutor(max_workers=1) as executor:
+        asyncio.run(run(executor))
+
+
+def check_hash_file():
+    print('check file API')
+    msg = msg_generator(0, 3000 * 8)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp).joinpath('msg.bin')
+        path.write_bytes(msg)
+        assert hashlib.sha3_256(msg).digest() == sha3bit.hash_file(path, 'sha3_256')
+        assert hashlib.sha3_512(msg).digest() == sha3bit.hash_file(path, sha3bit.sha3_512, chunk_size=100)
+        assert hashlib.shake_256(msg).digest(300) == sha3bit.shake_file(path, 'SHAKE-256', 300)
+        expected = sha3_256(msg, bitlen=2001 * 8 + 5).digest()
+        assert expected == sha3bit.hash_file(path, 'sha3_256', bitlen=2001 * 8 + 5, chunk_size=1)
+        path.write_bytes(b'')
+        assert hashlib.sha3_224(b'').digest() == sha3bit.hash_file(path, 'sha3_224')
+
+
+def check_lazy_imports():
+    print('check lazy imports')
+    import subprocess
+    import sys
+
+    code = (
+        'import sys\n'
+        'from sha3bit import cli, sha3_256, shake_128\n'
+        'sha3_256(b"abc").digest()\n'
+        'shake_128(b"abc").squeez(500)\n'
+        "cli.main(['--sha3-256', '0x61, 0x62, 0x63'])\n"
+        "assert 'bitarray' not in sys.modules\n"
+        "assert 'pysatl' not in sys.modules\n"
+        'h = sha3_256(b"abc", bitlen=3)\n'
+        'h.update(b"abc", bitlen=21)\n'
+        'h.digest()\n'
+        "assert 'bitarray' not in sys.modules\n"
+        "assert 'pysatl' not in sys.modules\n"
+    )
+    root = Path(__file__).resolve().parent.parent
+    cmd = [sys.executable, '-c', code]
+    out = subprocess.run(cmd, cwd=str(root), check=True, stdout=subprocess.PIPE).stdout  # noqa: S603
+    assert b'3A 98 5D A7 4F E2 25 B2 04 5C 17 2D 6B D3 90 BD 85 5F 08 6E 3E 9D 52 5B 46 BF E2 45 11 43 15 32\n' == out
+
+
+def check_bench():
+    print('check bench')
+    from sha3bit import bench
+
+    names = ['f1600', 'sha3_256_64', 'copy', 'import']
+    results = bench.run(sizes=[64], min_time=0.001, repeat=1, names=names)
+    assert names == [r['name'] for r in results]
+    for r in results:
+        assert r['ns_per_op'] > 0
+    assert 'hashlib_ns_per_op' not in results[0]
+    assert results[1]['mb_per_s'] > 0
+    assert results[1]['hashlib_ns_per_op'] > 0
+    baseline = {'results': results}
+    slower = [dict(r, ns_per_op=r['ns_per_op'] * 1.5) for r in results]
+    assert [] == bench.compare(baseline, {'results': results})
+    assert [] == bench.compare(baseline, {'results': slower}, threshold=0.6)
+    assert names == [name for name, _, _ in bench.compare(baseline, {'results': slower}, threshold=0.1)]
+    with tempfile.TemporaryDirectory() as tmp:
+        before = Path(tmp) / 'before.json'
+        after = Path(tmp) / 'after.json'
+        assert 0 == bench.main(['--only', 'copy', '--min-time', '0.001', '--repeat', '1', '--json', str(before)])
+        with open(before) as f:
+            report = json.load(f)
+        report['results'][0]['ns_per_op'] *= 2
+        with open(after, 'w') as f:
+            json.dump(report, f)
+        assert 0 == bench.main(['--compare', str(before), str(before)])
+        assert 1 == bench.main(['--compare', str(before), str(after)])
+
+
+def check_cli_files():
+    print('check CLI: files')
+    import contextlib
+    import io
+
+    from sha3bit import cli
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        tmp.joinpath('sub').mkdir()
+        msgs = {'a.bin': b'abc', 'b.bin': msg_generator(0, 5000 * 8), 'sub/c.bin': b''}
+        for name, msg in msgs.items():
+            tmp.joinpath(name).write_bytes(msg)
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            assert 0 == cli.main(['--sha3-384', '-r', '-j', '2', '--files', str(tmp)])
+        manifest = out.getvalue()
+        for name, msg in msgs.items():
+            assert '%s  %s\n' % (hashlib.sha3_384(msg).hexdigest(), tmp.joinpath(name)) in manifest
+        tmp.joinpath('SUMS').write_text(manifest)
+        with contextlib.redirect_stdout(io.StringIO()):
+            assert 0 == cli.main(['--sha3-384', '-j', '1', '--check', str(tmp.joinpath('SUMS'))])
+        tmp.joinpath('a.bin').write_bytes(b'abd')
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out), contextlib.redirect_stderr(io.StringIO()):
+            assert 1 == cli.main(['--sha3-384', '--check', str(tmp.joinpath('SUMS'))])
+        assert '%s: FAILED\n' % tmp.joinpath('a.bin') in out.getvalue()
 
 
 def check_api_xof():
@@ -245,6 +773,19 @@ def check_api_xof():
             assert r1 == expected1
             r2 = dut.squeez(len(expected2))
             assert r2 == expected2
+    # squeeze_into fills caller provided buffers
+    expected = hashlib.shake_128().digest(2000)
+    dut = shake_128()
+    out = bytearray(2000)
+    view = memoryview(out)
+    for start, end in [(0, 5), (5, 5), (5, 500), (500, 836), (836, 2000)]:
+        assert end - start == dut.squeeze_into(view[start:end])
+    assert expected == out
+    try:
+        dut.update(b'0')
+        raise AssertionError('update after squeez not detected')
+    except Exception as e:
+        assert 'Already finalized' == str(e)
 
 
 def check_api_xof_absorb():
@@ -270,13 +811,600 @@ def check_api_xof_absorb():
             dut.update(m1.tobytes(), bitlen=len(m1))
             dut.update(m2.tobytes(), bitlen=len(m2))
             assert dut.digest(output_size) == expected
+    # buffering goes back to byte granularity once bit lengths add up to full bytes
+    for i in range(1, 16):
+        dut = shake_128()
+        dut.update(msgbits[0:i].tobytes(), bitlen=i)
+        dut.update(msgbits[i:16].tobytes(), bitlen=16 - i)
+        dut = shake_128.import_state(dut.export_state())
+        dut.update(msg[2:])
+        assert dut.digest(output_size) == expected
+
+
+def check_bit_stream():
+    print('check bit stream')
+    # bit fields of any length, checked against the padding of sha3bit.batch done on the whole message
+    from sha3bit import batch
+
+    msg = hashlib.shake_128(b'bit stream').digest(1000)
+    msgbits = bitarray(endian='little')
+    msgbits.frombytes(msg)
+    lengths = [13, 1, 7, 8, 3, 64, 5, 1087, 2, 9, 1089, 6, 4000]
+    for first in range(8):
+        dut = sha3_256()
+        dut.update(msg, bitlen=first)
+        pos = first
+        for n in lengths:
+            dut.update(msgbits[pos : pos + n].tobytes(), bitlen=n)
+            pos += n
+        assert dut.digest() == batch.sha3_256_many([msg], bitlens=[pos])[0]
+    # bitarray input, in both bit orders
+    dut = shake_128(msgbits[0:5])
+    dut.update(msgbits[5:1000])
+    big = bitarray(msgbits[1000:2003].to01(), endian='big')
+    dut.update(big[0:500])
+    dut.update(big[500:] + big[0:3], bitlen=503)  # bitlen can be given for bitarray input as well
+    assert dut.digest(40) == batch.shake_128_many([msg], 40, bitlens=[2003])[0]
+    # export and import while bits are pending
+    dut = sha3_256(msg, bitlen=1003)
+    assert 1003 == dut.export_state()['bitlen']
+    restored = sha3_256.import_state(dut.export_state())
+    restored2 = sha3_256.import_state_bytes(dut.export_state_bytes())
+    for h in (dut, restored, restored2):
+        h.update(msgbits[1003:2000].tobytes(), bitlen=997)
+    expected = hashlib.sha3_256(msg[0:250]).digest()
+    assert expected == dut.digest() == restored.digest() == restored2.digest()
+    # suffix and padding spilling over the next block
+    rate = 1088
+    for bitlen in range(rate - 12, rate + 2):
+        dut = sha3_256(msg, bitlen=bitlen % 8)
+        dut.update(msgbits[bitlen % 8 : bitlen].tobytes(), bitlen=bitlen - bitlen % 8)
+        assert dut.digest() == batch.sha3_256_many([msg], bitlens=[bitlen])[0]
+        dut = shake_128(msgbits[0:bitlen])
+        assert dut.digest(16) == batch.shake_128_many([msg], 16, bitlens=[bitlen])[0]
+
+
+def check_memory_footprint():
+    print('check memory footprint')
+    import tracemalloc
+
+    for cls in (sha3bit.sha3_224, sha3_256, sha3bit.sha3_384, sha3bit.sha3_512, shake_128, sha3bit.shake_256):
+        h = cls(bytes(range(200)), bitlen=1597)
+        assert not hasattr(h, '__dict__')
+        assert not hasattr(h._h, '__dict__')
+        # fresh objects holding their own lanes, created without permutations to keep tracemalloc fast
+        state = h.export_state_bytes()
+        n = 1000
+        tracemalloc.start()
+        try:
+            before = tracemalloc.get_traced_memory()[0]
+            objects = [cls.import_state_bytes(state) for _ in range(n)]
+            per_object = (tracemalloc.get_traced_memory()[0] - before) / n
+        finally:
+            tracemalloc.stop()
+        assert state == objects[-1].export_state_bytes()
+        assert per_object < 720, (cls.__name__, per_object)
+
+
+def check_xof_reader():
+    print('check XOF reader')
+    import io
+    import shutil
+
+    expected = hashlib.shake_256(b'abc').digest(5000)
+    h = sha3bit.shake_256(b'abc')
+    reader = h.reader()
+    assert reader.readable()
+    assert not reader.seekable()
+    assert expected[0:7] == reader.read(7)
+    buf = bytearray(300)
+    assert 300 == reader.readinto(buf)
+    assert expected[7:307] == buf
+    assert expected[307:320] == h.squeez(13)  # the reader and the object share the output
+    try:
+        reader.read()
+        raise AssertionError('unbounded read')
+    except ValueError:
+        pass
+    reader.close()
+    try:
+        reader.read(1)
+        raise AssertionError('read after close')
+    except ValueError:
+        pass
+
+    # bounded stream: EOF after length bytes, buffered and copied like a file
+    out = io.BytesIO()
+    shutil.copyfileobj(sha3bit.shake_256(b'abc').reader(5000), out, 1000)
+    assert expected == out.getvalue()
+    with io.BufferedReader(sha3bit.shake_256(b'abc').reader(5000)) as f:
+        assert expected[0:10] == f.read(10)
+        assert expected[10:] == f.read()
+        assert b'' == f.read(1)
+    for name in ('read', 'readall'):
+        reader = sha3bit.shake_256(b'abc').reader(10)
+        assert expected[0:10] == getattr(reader, name)()
+        assert b'' == getattr(reader, name)()
+
+    h = sha3bit.shake_256(b'abc')
+    blocks = h.iter_blocks()
+    chunks = [next(blocks) for _ in range(3)]
+    assert [h.block_size] * 3 == [len(c) for c in chunks]
+    assert expected[0 : 3 * h.block_size] == b''.join(chunks)
+    chunks = list(sha3bit.shake_256(b'abc').iter_blocks(1000, length=4999))
+    assert [1000] * 4 + [999] == [len(c) for c in chunks]
+    assert expected[0:4999] == b''.join(chunks)
+
+    h = shake_128(b'abc')
+    assert hashlib.shake_128(b'abc').digest(20).hex() == h.hexsqueez(10) + h.hexsqueez(10)
+
+
+def check_hashing_streams():
+    print('check hashing streams')
+    import io
+    import shutil
+    import tarfile
+    import zipfile
+
+    data = hashlib.shake_128(b'hashing streams').digest(100000)
+    expected = hashlib.sha3_256(data).digest()
+
+    dest = io.BytesIO()
+    with sha3bit.HashingWriter(dest, 'sha3_256') as w:
+        shutil.copyfileobj(io.BytesIO(data), w, 4099)
+        assert len(data) == w.tell()
+        out = w.detach()
+    assert w.closed
+    assert not out.closed
+    assert data == out.getvalue()
+    assert expected == w.digest()
+
+    w = sha3bit.HashingWriter(io.BytesIO(), sha3bit.shake_256)
+    w.write(memoryview(array.array('I', [1, 2, 3])))
+    assert hashlib.shake_256(array.array('I', [1, 2, 3]).tobytes()).hexdigest(40) == w.hexdigest(40)
+    w.close()
+    try:
+        w.write(b'abc')
+        raise AssertionError('write after close')
+    except ValueError:
+        pass
+
+    # archives written through the writer: the digest covers all the bytes of the archive
+    for make in (
+        lambda f: tarfile.open(fileobj=f, mode='w'),
+        lambda f: zipfile.ZipFile(f, mode='w', compression=zipfile.ZIP_DEFLATED),
+    ):
+        dest = io.BytesIO()
+        w = sha3bit.HashingWriter(dest, 'sha3_512')
+        with make(w) as archive:
+            if isinstance(archive, tarfile.TarFile):
+                info = tarfile.TarInfo('data.bin')
+                info.size = len(data)
+                archive.addfile(info, io.BytesIO(data))
+            else:
+                archive.writestr('data.bin', data)
+        w.flush()
+        assert hashlib.sha3_512(dest.getvalue()).digest() == w.digest()
+
+    r = sha3bit.HashingReader(io.BytesIO(data), 'sha3_256')
+    assert data[0:10] == r.read(10)
+    buf = bytearray(1000)
+    assert 1000 == r.readinto(buf)
+    assert data[10:1010] == buf
+    assert data[1010:2000] == r.read1(990)
+    out = io.BytesIO()
+    shutil.copyfileobj(io.BufferedReader(r, 333), out)
+    assert data[2000:] == out.getvalue()
+    assert len(data) == r.tell()
+    assert expected == r.digest()
+
+    tar = io.BytesIO()
+    with tarfile.open(fileobj=tar, mode='w') as archive:
+        info = tarfile.TarInfo('data.bin')
+        info.size = len(data)
+        archive.addfile(info, io.BytesIO(data))
+    with sha3bit.HashingReader(io.BytesIO(tar.getvalue()), 'sha3_384') as r:
+        with tarfile.open(fileobj=r, mode='r|') as archive:
+            for member in archive:
+                assert data == archive.extractfile(member).read()
+        shutil.copyfileobj(r, io.BytesIO())  # end of archive padding
+        assert hashlib.sha3_384(tar.getvalue()).digest() == r.digest()
+
+    class ShortWriteRaw(io.RawIOBase):
+        """Raw stream writing at most size bytes per call, nothing once full"""
+
+        def __init__(self, size, capacity=None):
+            self.data = bytearray()
+            self._size = size
+            self._capacity = capacity
+
+        def writable(self):
+            return True
+
+        def write(self, b):
+            n = min(self._size, len(b))
+            if self._capacity is not None:
+                n = min(n, self._capacity - len(self.data))
+            self.data += bytes(b)[0:n]
+            return n
+
+    dest = ShortWriteRaw(3)
+    w = sha3bit.HashingWriter(dest, 'sha3_256')
+    shutil.copyfileobj(io.BytesIO(data[0:2560]), w)
+    assert data[0:2560] == dest.data
+    assert 2560 == w.tell()
+    assert hashlib.sha3_256(data[0:2560]).digest() == w.digest()
+    dest = ShortWriteRaw(3, capacity=100)
+    w = sha3bit.HashingWriter(dest, 'sha3_256')
+    try:
+        w.write(data[0:1000])
+        raise AssertionError('full stream accepted all the data')
+    except BlockingIOError as e:
+        assert 100 == e.characters_written
+    assert 100 == w.tell()
+    assert hashlib.sha3_256(data[0:100]).digest() == w.digest()
+
+    class NonBlockingRaw(io.RawIOBase):
+        """Raw stream returning None once before each chunk, like a non blocking pipe without data"""
+
+        def __init__(self, data):
+            self._data = io.BytesIO(data)
+            self._ready = False
+
+        def readable(self):
+            return True
+
+        def readinto(self, b):
+            self._ready = not self._ready
+            if not self._ready:
+                return None
+            return self._data.readinto(b)
+
+    for method in ('read', 'read1', 'readinto'):
+        r = sha3bit.HashingReader(NonBlockingRaw(data), 'sha3_256')
+        chunks = []
+        while True:
+            if 'readinto' == method:
+                buf = bytearray(5000)
+                n = r.readinto(buf)
+                chunk = None if n is None else buf[0:n]
+            else:
+                chunk = getattr(r, method)(5000)
+            if chunk is None:
+                continue
+            if not chunk:
+                break
+            chunks.append(chunk)
+        assert data == b''.join(chunks)
+        assert expected == r.digest()
+
+
+def check_trace():
+    print('check trace')
+    import io
+
+    from sha3bit import trace
+
+    msg = bytes(range(256)) * 2
+    steps = []
+    blocks = []
+    instrumentation = sha3bit.Instrumentation(
+        on_block=blocks.append, on_step=lambda r, step, lanes: steps.append((step, r, tuple(lanes)))
+    )
+    expected = sha3_256(msg, instrumentation=instrumentation).digest()
+    recorder = trace.TraceRecorder()
+    assert expected == sha3_256(msg, instrumentation=recorder).digest()
+    assert 4 == recorder.blocks_absorbed
+    assert 4 + 4 * 24 * 4 == len(recorder)
+    records = list(trace.iter_records(recorder))
+    assert [('block', 0, b) for b in blocks] == [r for r in records if 'block' == r[0]]
+    assert steps == [r for r in records if 'block' != r[0]]
+    assert records[1][2] != records[2][2]
+
+    # preallocated buffer and file streaming hold the same records
+    stream = io.BytesIO()
+    sha3_256(msg, instrumentation=trace.TraceRecorder(stream)).digest()
+    buf = bytearray(len(recorder) * trace.RECORD.size)
+    sha3_256(msg, instrumentation=trace.TraceRecorder(buf)).digest()
+    assert recorder.getbuffer() == stream.getvalue() == buf
+    stream.seek(0)
+    assert records == list(trace.iter_records(stream))
+    small = trace.TraceRecorder(bytearray(10 * trace.RECORD.size))
+    try:
+        sha3_256(msg, instrumentation=small)
+        raise AssertionError('buffer overflow')
+    except ValueError:
+        assert 10 == len(small)
+
+    blocks_only = trace.TraceRecorder(steps=False)
+    sha3_256(msg, instrumentation=blocks_only).digest()
+    assert records[0] == next(trace.iter_records(blocks_only))
+    assert 4 == len(blocks_only)
+
+    table = recorder.to_numpy()
+    assert 4 + 4 * 24 * 4 == len(table)
+    assert list(records[-1][2]) == table['lanes'][-1].tolist()
+    assert [1, 2, 3, 4] == table['kind'][1:5].tolist()
+
+    text = list(trace.render(blocks_only.getbuffer()[0 : trace.RECORD.size]))
+    assert 1 == len(text)
+    assert text[0] == 'process block:\n' + sha3bit.Keccak._state_str(list(blocks[0]) + [0] * 8, limit=17)
+    text = next(trace.render(recorder.getbuffer()[trace.RECORD.size :]))
+    assert text.startswith('state after round 0 theta:\n')
+
+
+def check_accelerated():
+    print('check accelerated')
+    msg = hashlib.shake_128(b'accelerated').digest(1000)
+    msgbits = bitarray(endian='little')
+    msgbits.frombytes(msg)
+    for cls in (sha3bit.sha3_224, sha3_256, sha3bit.sha3_384, sha3bit.sha3_512, shake_128, sha3bit.shake_256):
+        expected = cls(msg, bitlen=7997)
+        h = cls(msg[0:300], accelerated=True)
+        assert type(h._h) is not sha3bit.Keccak
+        copied = h.copy()
+        h.update(msg[300:])
+        copied.update(msg[300:], bitlen=700 * 8)  # byte aligned bitlen keeps the hashlib backend
+        state = h.export_state_bytes()  # exporting keeps the hashlib backend
+        assert type(h._h) is not sha3bit.Keccak
+        assert cls.import_state_bytes(state).export_state_bytes() == state
+        model = getattr(hashlib, cls.__name__)(msg)
+        if issubclass(cls, sha3bit.sha3_224):
+            assert model.digest() == h.digest() == copied.digest()
+        else:
+            assert model.digest(500) == h.digest(500) == copied.digest(500)
+            # consecutive squeezes continue the output from hashlib, an export rebuilds a Keccak state aside
+            assert model.digest(500) == h.squeez(200) + h.squeez(300)
+            state = h.export_state_bytes()
+            assert model.digest(600)[500:] == h.squeez(100)
+            assert h._h._keccak is None
+            assert model.digest(600)[500:] == cls.import_state_bytes(state).squeez(100)
+        # non byte aligned input switches to the pure Python sponge
+        h = cls(msg[0:500], accelerated=True)
+        h.update(msgbits[4000:7997])
+        assert expected.export_state_bytes() == h.export_state_bytes()
+
+    # tracing is served by the pure Python sponge
+    assert type(sha3_256(accelerated=True, instrumentation=sha3bit.Instrumentation())._h) is not type(
+        sha3_256(accelerated=True)._h
+    )
+    # the state cannot be rebuilt once more than HASHLIB_REPLAY_LIMIT bytes went to hashlib
+    big = bytes(sha3bit.HASHLIB_REPLAY_LIMIT + 1)
+    h = sha3_256(big, accelerated=True)
+    assert hashlib.sha3_256(big).digest() == h.copy().digest()
+    try:
+        h.update(b'\x01', bitlen=1)
+        raise AssertionError('state rebuilt without its input')
+    except ValueError:
+        pass
+    # SHAKE output continues from hashlib past the limit: squeez, reader and iter_blocks
+    model = hashlib.shake_128(big).digest(3000)
+    h = shake_128(big, accelerated=True)
+    assert model[0:10] == h.squeez(10)
+    assert model[10:20] == h.squeez(10)
+    reader = h.reader(1000)
+    assert model[20:520] == reader.read(500)
+    assert model[520:1020] == reader.read()
+    assert model[1020:3000] == b''.join(h.iter_blocks(100, length=1980))
+
+
+def check_turboshake_kangarootwelve():
+    print('check TurboSHAKE and KangarooTwelve')
+    import concurrent.futures
+
+    def ptn(n):
+        return bytes(i % 251 for i in range(n))
+
+    # test vectors from RFC 9861
+    vectors = (
+        (sha3bit.turboshake_128(), 32, '1e415f1c5983aff2169217277d17bb538cd945a397ddec541f1ce41af2c1b74c'),
+        (sha3bit.turboshake_128(ptn(17**2)), 32, '96c77c279e0126f7fc07c9b07f5cdae1e0be60bdbe10620040e75d7223a624d2'),
+        (
+            sha3bit.turboshake_128(b'\xff\xff\xff', domain=0x06),
+            32,
+            '3d03988bb59e681851a192f429ae03988e8f444bc06036a3f1a7d2ccd758d174',
+        ),
+        (
+            sha3bit.turboshake_256(),
+            64,
+            '367a329dafea871c7802ec67f905ae13c57695dc2c6663c61035f59a18f8e7db'
+            '11edc0e12e91ea60eb6b32df06dd7f002fbafabb6e13ec1cc20d995547600db0',
+        ),
+        (sha3bit.kangarootwelve_128(), 32, '1ac2d450fc3b4205d19da7bfca1b37513c0803577ac7167f06fe2ce1f0ef39e5'),
+        (
+            sha3bit.kangarootwelve_128(ptn(17**4)),
+            32,
+            '8701045e22205345ff4dda05555cbb5c3af1a771c2b89baef37db43d9998b9fe',
+        ),
+        (
+            sha3bit.kangarootwelve_128(b'\xff\xff\xff', customization=ptn(41**2)),
+            32,
+            'c389e5009ae57120854c2e8c64670ac01358cf4c1baf89447a724234dc7ced74',
+        ),
+        (
+            sha3bit.kangarootwelve_256(),
+            64,
+            'b23d2e9cea9f4904e02bec06817fc10ce38ce8e93ef4c89e6537076af8646404'
+            'e3e8b68107b8833a5d30490aa33482353fd4adc7148ecb782855003aaebde4a9',
+        ),
+    )
+    for h, length, expected in vectors:
+        assert expected == h.hexdigest(length)
+
+    # 24 rounds of Keccak-p are Keccak-f, TurboSHAKE is the state after 12 of them
+    lanes = [[(x + 5 * y) * 0x0123456789ABCDEF % (1 << 64) for x in range(5)] for y in range(5)]
+    assert sha3bit.Keccak.f1600(lanes) == sha3bit.Keccak.f1600(lanes, rounds=24)
+    assert sha3bit.Keccak.f1600(lanes, rounds=12) == sha3bit.Keccak.f1600(lanes, rounds=12, verbose=True)
+    assert sha3bit.Keccak.f1600(lanes) != sha3bit.Keccak.f1600(lanes, rounds=12)
+    assert sha3bit.turboshake_128(domain=0x1F)._h.export_state()['rounds'] == 12
+    h = sha3bit.turboshake_256(ptn(1000), domain=0x0B)
+    assert h.digest(100) == sha3bit.turboshake_256.import_state_bytes(h.export_state_bytes()).digest(100)
+    assert h.digest(100) == sha3bit.turboshake_256.import_state(h.export_state()).digest(100)
+    assert h.digest(100) == h.squeez(30) + h.squeez(70)
+    for domain in (0, 0x80):
+        try:
+            sha3bit.turboshake_128(domain=domain)
+            raise AssertionError('domain 0x%02X accepted' % domain)
+        except ValueError:
+            pass
+    try:
+        sha3bit.turboshake_128(b'\x01', bitlen=1)
+        raise AssertionError('TurboSHAKE accepted a partial byte')
+    except ValueError:
+        pass
+
+    assert not hasattr(sha3bit.kangarootwelve_256(), '__dict__')
+    # chunks of the tree are the same whatever the updates, C and its length may start new leaves
+    msg = ptn(8192 * 5 + 100)
+    for size in (0, 1, 8191, 8192, 8193, len(msg)):
+        for customization in (b'', ptn(8190), ptn(9000)):
+            expected = sha3bit.kangarootwelve_128(msg[0:size], customization=customization).digest(40)
+            h = sha3bit.kangarootwelve_128(customization=customization)
+            for pos in range(0, size, 3000):
+                h.update(msg[pos : min(pos + 3000, size)])
+            h2 = sha3bit.kangarootwelve_128.import_state(h.copy().export_state())
+            assert expected == h.digest(40) == h2.digest(40)
+            assert expected == h.squeez(10) + h.squeez(30)
+    group_bytes = sha3bit._LEAF_GROUP_BYTES
+    sha3bit._LEAF_GROUP_BYTES = 8192 * 2  # many small groups to exercise the dispatch
+    try:
+        expected = sha3bit.kangarootwelve_256(msg).digest(64)
+        for executor_class in (concurrent.futures.ThreadPoolExecutor, concurrent.futures.ProcessPoolExecutor):
+            with executor_class(max_workers=2) as executor:
+                h = sha3bit.kangarootwelve_256(executor=executor)
+                for pos in range(0, len(msg), 1234):
+                    h.update(msg[pos : pos + 1234])
+                h2 = h.copy()
+                assert expected == h.digest(64)
+                h2.update(b'x')
+                assert expected != h2.digest(64)
+    finally:
+        sha3bit._LEAF_GROUP_BYTES = group_bytes
+
+
+def check_hash_many():
+    print('check hash_many')
+    import concurrent.futures
+
+    msgs = [msg_generator(i, (i % 300) * 8) for i in range(100)]
+    bitlens = [None if i % 3 else max(len(m) * 8 - 5, 0) for i, m in enumerate(msgs)]
+    expected = [sha3bit.sha3_512(m, bitlen=bitlen).digest() for m, bitlen in zip(msgs, bitlens)]
+    for workers in (1, 2, 3):
+        assert [hashlib.sha3_256(m).digest() for m in msgs] == sha3bit.hash_many(msgs, 'sha3_256', workers=workers)
+        assert expected == sha3bit.hash_many(msgs, sha3bit.sha3_512, workers=workers, bitlens=bitlens)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=2) as executor:
+        outputs = sha3bit.hash_many(msgs, 'shake_128', outlen=300, executor=executor)
+        assert [hashlib.shake_128(m).digest(300) for m in msgs] == outputs
+        assert [hashlib.shake_256(m).digest(32) for m in msgs] == sha3bit.hash_many(
+            msgs, 'shake_256', executor=executor
+        )
+    assert [] == sha3bit.hash_many([], 'sha3_224', workers=2)
+    # workers started before the shared memory is created do not leave it to their own resource tracker,
+    # which would warn about leaked objects at shutdown
+    import os
+    import subprocess
+    import sys
+
+    code = (
+        'import concurrent.futures, os, sha3bit\n'
+        'with concurrent.futures.ProcessPoolExecutor(max_workers=2) as executor:\n'
+        '    [executor.submit(os.getpid).result() for _ in range(4)]\n'
+        '    sha3bit.hash_many([bytes(i) for i in range(50)], "sha3_256", executor=executor)\n'
+    )
+    env = dict(os.environ, PYTHONPATH=str(Path(__file__).parent.parent))
+    result = subprocess.run(  # noqa: S603
+        [sys.executable, '-c', code], env=env, capture_output=True, text=True, check=True
+    )
+    assert '' == result.stderr, result.stderr
+
+    # without multiprocessing.shared_memory (Python 3.7) ranges of messages are pickled to the workers
+
+    shared_memory = sys.modules.get('multiprocessing.shared_memory')
+    sys.modules['multiprocessing.shared_memory'] = None
+    try:
+        assert expected == sha3bit.hash_many(msgs, 'sha3_512', workers=2, bitlens=bitlens)
+    finally:
+        if shared_memory is None:
+            del sys.modules['multiprocessing.shared_memory']
+        else:
+            sys.modules['multiprocessing.shared_memory'] = shared_memory
+    for kwargs in ({'outlen': 20}, {'bitlens': [8, 8]}, {'bitlens': [100] * len(msgs)}):
+        try:
+            sha3bit.hash_many(msgs, 'sha3_256', workers=2, **kwargs)
+            raise AssertionError('invalid arguments accepted: %s' % kwargs)
+        except ValueError:
+            pass
+
+
+def check_shake_digest_cache():
+    print('check SHAKE digest cache')
+    msg = msg_generator(25, 500 * 8)
+    for cls in (shake_128, sha3bit.shake_256, sha3bit.cshake_128, sha3bit.turboshake_256):
+        model = cls(msg).digest(1000)
+        h = cls(msg[0:200])
+        h.digest(10)
+        h.update(msg[200:])  # invalidates the finalized state
+        assert model[0:32] == h.digest(32)
+        finalized = h._xof
+        # shorter digests are prefixes of the cached output, longer ones extend it
+        assert model[0:5] == h.digest(5)
+        assert model[0:1000] == h.digest(1000)
+        assert model[0:500].hex() == h.hexdigest(500)
+        assert finalized is h._xof and 1000 == len(h._output)
+        copied = h.copy()
+        assert copied._xof is None and model == copied.digest(1000)
+        copied.update(b'x')
+        assert model != copied.digest(1000) and model == h.digest(1000)
+        # squeezing moves the sponge itself, digest() then restarts from its current state
+        assert model[0:100] == h.squeez(100)
+        assert h._xof is None
+        assert model[100:200] == h.digest(100)
+        h = cls(msg)
+        h.digest(64)
+        assert model[0:300] == b''.join(h.iter_blocks(100, length=300))
+        assert model[300:364] == h.digest(64)
+    h = shake_128(msg, accelerated=True)
+    assert hashlib.shake_128(msg).digest(100) == h.digest(50) + h.digest(100)[50:]
+    # accelerated objects are served by hashlib, even once the Keccak state cannot be rebuilt
+    big = msg_generator(26, 8 * (sha3bit.HASHLIB_REPLAY_LIMIT + 1))
+    model = hashlib.shake_256(big).digest(5000)
+    h = sha3bit.shake_256(big, accelerated=True)
+    for length in (32, 64, 1000, 5000):
+        assert model[0:length] == h.digest(length)
+    assert model[0:100].hex() == h.hexdigest(100)
+    assert h._xof is None
 
 
 if __name__ == '__main__':
+    check_f1600()
     check_api_xof_absorb()
+    check_bit_stream()
     check_api_xof()
+    check_shake_digest_cache()
+    check_xof_reader()
     check_api()
+    check_api_copy()
+    check_accelerated()
+    check_instrumentation()
+    check_trace()
+    check_memory_footprint()
+    check_prefix_cache()
+    check_api_state_bytes()
+    check_api_buffers()
+    check_batch()
+    check_hash_file()
+    check_hash_many()
+    check_hashing_streams()
+    check_aio()
+    check_cli_files()
+    check_lazy_imports()
+    check_bench()
     check_hardcoded_test_vectors()
+    check_sp800_185_samples()
+    check_parallelhash()
+    check_turboshake_kangarootwelve()
+    check_kmac_samples()
+    check_mac()
     check_xof_against_hashlib(n_seeds=3, max_length=1024 * 4)
     check_against_hashlib(n_seeds=3, max_length=1024 * 4)
     check_against_nist_cavp()
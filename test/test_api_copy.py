@@ -0,0 +1,9 @@
+from test import test
+
+
+def test_it():
+    test.check_api_copy()
+
+
+if __name__ == '__main__':
+    test_it()
@@ -0,0 +1,9 @@
+from test import test
+
+
+def test_it():
+    test.check_f1600()
+
+
+if __name__ == '__main__':
+    test_it()
@@ -0,0 +1,9 @@
+from test import test
+
+
+def test_it():
+    test.check_turboshake_kangarootwelve()
+
+
+if __name__ == '__main__':
+    test_it()